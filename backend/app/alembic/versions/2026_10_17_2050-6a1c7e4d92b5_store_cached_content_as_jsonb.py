@@ -0,0 +1,74 @@
+"""Store cached content as JSONB
+
+Converts in batches that commit on their own, so an interrupted upgrade
+picks up where it stopped when run again. Rows an older app version refreshes
+while the batches run keep the payload converted before; it is only a cache.
+
+Revision ID: 6a1c7e4d92b5
+Revises: 0d6e9b3f7a52
+Create Date: 2026-10-17 20:50:36.417529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1c7e4d92b5'
+down_revision = '0d6e9b3f7a52'
+branch_labels = None
+depends_on = None
+
+# Primary key of each cache table.
+TABLES = {'mediafile': 'id', 'userfile': 'id', 'searchfile': 'search_query'}
+BATCH_SIZE = 1000
+
+INDEXES = [
+    "ix_mediafile_content ON mediafile USING gin (content jsonb_path_ops)",
+    "ix_mediafile_start_year ON mediafile (((content #>> '{startDate,year}'::text[])::integer))",
+    "ix_mediafile_popularity ON mediafile (((content ->> 'popularity')::integer))",
+    "ix_userfile_content ON userfile USING gin (content jsonb_path_ops)",
+    "ix_searchfile_content ON searchfile USING gin (content jsonb_path_ops)",
+]
+
+
+def upgrade():
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        for table, key in TABLES.items():
+            op.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS content_jsonb JSONB')
+            while connection.execute(
+                sa.text(
+                    f'UPDATE {table} SET content_jsonb = content::jsonb '
+                    f'WHERE {key} IN (SELECT {key} FROM {table} '
+                    'WHERE content_jsonb IS NULL LIMIT :batch_size)'
+                ),
+                {'batch_size': BATCH_SIZE},
+            ).rowcount:
+                pass
+
+    for table in TABLES:
+        # Rows inserted since their table's batches finished.
+        op.execute(
+            f'UPDATE {table} SET content_jsonb = content::jsonb '
+            'WHERE content_jsonb IS NULL'
+        )
+        op.drop_column(table, 'content')
+        op.alter_column(table, 'content_jsonb', new_column_name='content', nullable=False)
+
+    with op.get_context().autocommit_block():
+        for index in INDEXES:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}')
+
+
+def downgrade():
+    for index in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {index.split()[0]}')
+    for table in TABLES:
+        op.alter_column(
+            table,
+            'content',
+            type_=sqlmodel.sql.sqltypes.AutoString(),
+            postgresql_using='content::text',
+        )
@@ -68,6 +68,63 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Pooled AniList HTTP clients. HTTP/2 requires the optional h2 package.
+    ANILIST_HTTP2: bool = False
+    ANILIST_MAX_CONNECTIONS: int = 20
+    ANILIST_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    ANILIST_KEEPALIVE_EXPIRY: float = 30.0
+    ANILIST_CONNECT_TIMEOUT: float = 10.0
+    ANILIST_TIMEOUT: float = 60.0
+    ANILIST_MAX_QUERY_COMPLEXITY: int = 500
+    # Fields fetched for recommended and related media: "slim" only has what
+    # the graph draws, "full" every field fetched for the media itself.
+    ANILIST_NEIGHBOR_PROFILE: Literal["slim", "full"] = "slim"
+    # Recommendations are paged through, best rated first, until this many are
+    # cached or they drop below the minimum rating.
+    ANILIST_MAX_RECOMMENDATIONS: int = 100
+    ANILIST_MIN_RECOMMENDATION_RATING: int = 1
+    # How outdated media are refreshed: "probe" first asks AniList for their
+    # updatedAt in bulk and only downloads the ones that changed; "refetch"
+    # downloads them all again. Probing doesn't notice new recommendations, so
+    # media are still downloaded in full every MAX_MEDIA_FULL_SYNC_AGE.
+    ANILIST_MEDIA_REVALIDATION: Literal["probe", "refetch"] = "probe"
+    # Seconds a queued request waits before it is promoted one priority class.
+    ANILIST_PRIORITY_AGING_SECONDS: float = 30.0
+    # Fair sharing of AniList requests between clients. Weights are keyed by
+    # client key (e.g. "ip:10.0.0.5") and default to 1.
+    ANILIST_MAX_IN_FLIGHT_PER_CLIENT: int = 2
+    ANILIST_CLIENT_WEIGHTS: dict[str, float] = {}
+    # "postgres" shares one rate limit budget across every worker and replica.
+    ANILIST_RATE_LIMITER: Literal["local", "postgres"] = "postgres"
+    # "token_bucket" bursts while AniList reports budget left in the window;
+    # "spacing" sends requests evenly spaced at the rate limit.
+    ANILIST_RATE_LIMIT_MODE: Literal["spacing", "token_bucket"] = "token_bucket"
+    # Requests of the reported budget the token bucket always leaves unused.
+    ANILIST_RATE_LIMIT_SAFETY_MARGIN: int = 2
+    # Optional cap on this process's own requests per minute, on top of the
+    # shared budget; e.g. for the cache warm-up running next to live traffic.
+    ANILIST_PROCESS_MAX_REQUESTS_PER_MINUTE: int | None = None
+    # Give up on AniList (and serve stale cache where there is one) after this
+    # many seconds of retrying, or straight away while the circuit is open.
+    ANILIST_REQUEST_DEADLINE: float = 20.0
+    ANILIST_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    ANILIST_CIRCUIT_RESET_SECONDS: float = 30.0
+    # Seconds between scans for cached media close to expiring, and how many
+    # are refreshed per scan. An interval of 0 turns the scans off.
+    ANILIST_BACKGROUND_REFRESH_INTERVAL: float = 300.0
+    ANILIST_BACKGROUND_REFRESH_BATCH: int = 100
+    # "zstd" compresses cached user lists, with the newest dictionary trained
+    # by app.media.train_dictionary if there is one. Lists already cached are
+    # read in whichever format they were stored in.
+    ANILIST_USER_LIST_COMPRESSION: Literal["none", "zstd"] = "none"
+    ANILIST_USER_LIST_COMPRESSION_LEVEL: int = 3
+    # Bytes of ready-to-send media, user list and search responses each worker
+    # keeps in memory, so repeated hits skip the database. 0 turns it off.
+    ANILIST_RESPONSE_CACHE_BYTES: int = 64 * 1024 * 1024
+    # Publish cache writes with Postgres NOTIFY, and listen for other workers'
+    # writes to drop their responses from memory.
+    ANILIST_CACHE_INVALIDATION: bool = True
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -0,0 +1,94 @@
+"""Long-lived, pooled HTTP clients used for every AniList request."""
+
+import importlib.util
+import logging
+import threading
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import httpx
+from fastapi import FastAPI
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_enabled() -> bool:
+    if not settings.ANILIST_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "ANILIST_HTTP2 is enabled but the h2 package is not installed; "
+            "falling back to HTTP/1.1",
+        )
+        return False
+    return True
+
+
+def _client_options() -> dict[str, Any]:
+    return {
+        "http2": _http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=settings.ANILIST_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ANILIST_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.ANILIST_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            settings.ANILIST_TIMEOUT,
+            connect=settings.ANILIST_CONNECT_TIMEOUT,
+        ),
+    }
+
+
+class AnilistClients:
+    """Owns the sync and async clients shared by every AniList request.
+
+    Clients are created lazily so scripts that never run the app lifespan can
+    still make requests; the lifespan closes them on shutdown.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync_client: httpx.Client | None = None
+        self._async_client: httpx.AsyncClient | None = None
+
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                self._sync_client = httpx.Client(**_client_options())
+            return self._sync_client
+
+    def async_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_client is None or self._async_client.is_closed:
+                self._async_client = httpx.AsyncClient(**_client_options())
+            return self._async_client
+
+    def close(self) -> None:
+        with self._lock:
+            sync_client, self._sync_client = self._sync_client, None
+        if sync_client is not None:
+            sync_client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        with self._lock:
+            async_client, self._async_client = self._async_client, None
+        if async_client is not None:
+            await async_client.aclose()
+
+
+anilist_clients = AnilistClients()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None]:
+    """Open the AniList clients with the app and close them on shutdown."""
+    anilist_clients.sync_client()
+    anilist_clients.async_client()
+    try:
+        yield
+    finally:
+        await anilist_clients.aclose()
@@ -0,0 +1,82 @@
+"""Fail fast while AniList is down instead of queueing requests behind it."""
+
+import threading
+import time
+from enum import StrEnum
+
+
+class AnilistUnavailableError(ValueError):
+    """AniList is erroring or rate limiting us and the request was given up.
+
+    ``retry_after`` is roughly how many seconds until it is worth trying again.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops calls to an unhealthy upstream until it has had time to recover.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call fails fast for ``reset_timeout`` seconds. Then a single trial
+    call is let through at a time: success closes the circuit, failure opens
+    it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self._lock = threading.Lock()
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go out now; pair it with a record_* call."""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+            now = time.monotonic()
+            # A trial call that never reports back doesn't hold the circuit
+            # half open forever; another one goes out after the same timeout.
+            if now - self._opened_at >= self._reset_timeout:
+                self._state = CircuitState.HALF_OPEN
+                self._opened_at = now
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through."""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return 0.0
+            elapsed = time.monotonic() - self._opened_at
+            return max(0.0, self._reset_timeout - elapsed)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == CircuitState.HALF_OPEN
+                or self._failures >= self._failure_threshold
+            ):
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
@@ -0,0 +1,166 @@
+"""Recommended and related media, stored once in node and edge tables.
+
+Cached media keep only their own attributes in ``MediaFile.content``. Their
+recommendations and relations are edges to ``MediaNode`` rows, so a media
+recommended by hundreds of others is stored, and refreshed, once. Responses
+get the embedded lists back from ``media_json``.
+"""
+
+import json
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import ColumnElement, Text, cast, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlmodel import Session, col, select
+
+from app.media.models import MediaFile, MediaNode, MediaRecommendation, MediaRelation
+from app.utils import tz_datetime
+
+
+def _pop_list(content: dict[str, Any], connection: str, field: str) -> list[Any]:
+    parent = content.get(connection)
+    if not isinstance(parent, dict):
+        return []
+    return parent.pop(field, None) or []
+
+
+def save_neighbours(session: Session, media_id: int, content: dict[str, Any]) -> None:
+    """Move the recommendations and relations of ``content`` to the edge tables.
+
+    ``content`` is left with the media's own attributes. Nodes without a media
+    (deleted on AniList) are dropped, as are repeats of a neighbour. Nothing
+    is committed.
+    """
+    nodes: dict[int, dict[str, Any]] = {}
+    recommendations: dict[int, dict[str, Any]] = {}
+    for node in _pop_list(content, "recommendations", "nodes"):
+        neighbour = (node or {}).get("mediaRecommendation")
+        if neighbour is None or neighbour["id"] in recommendations:
+            continue
+        nodes[neighbour["id"]] = neighbour
+        recommendations[neighbour["id"]] = {
+            "media_id": media_id,
+            "recommended_id": neighbour["id"],
+            "recommendation_id": node["id"],
+            "rating": node.get("rating"),
+            "position": len(recommendations),
+        }
+    relations: dict[int, dict[str, Any]] = {}
+    for edge in _pop_list(content, "relations", "edges"):
+        neighbour = (edge or {}).get("node")
+        if neighbour is None or neighbour["id"] in relations:
+            continue
+        nodes[neighbour["id"]] = neighbour
+        relations[neighbour["id"]] = {
+            "media_id": media_id,
+            "related_id": neighbour["id"],
+            "relation_type": edge.get("relationType"),
+            "position": len(relations),
+        }
+
+    session.exec(
+        delete(MediaRecommendation).where(
+            col(MediaRecommendation.media_id) == media_id,
+        ),
+    )
+    session.exec(delete(MediaRelation).where(col(MediaRelation.media_id) == media_id))
+    if recommendations:
+        session.exec(insert(MediaRecommendation).values(list(recommendations.values())))
+    if relations:
+        session.exec(insert(MediaRelation).values(list(relations.values())))
+    if nodes:
+        now = tz_datetime.now()
+        # Sorted so workers saving media with shared neighbours lock them in
+        # the same order.
+        statement = insert(MediaNode).values(
+            [
+                {"id": node_id, "content": json.dumps(node), "data_timestamp": now}
+                for node_id, node in sorted(nodes.items())
+            ],
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[col(MediaNode.id)],
+            set_={
+                "content": statement.excluded.content,
+                "data_timestamp": statement.excluded.data_timestamp,
+            },
+        )
+        session.exec(statement)
+
+
+def _embed(
+    content: ColumnElement[Any],
+    path: str,
+    items: ColumnElement[Any],
+) -> ColumnElement[Any]:
+    """Set ``path`` of ``content`` to ``items``, or ``[]`` if there are none.
+
+    Like AniList, media without the connection at all are left without it.
+    """
+    return func.jsonb_set(
+        content,
+        literal_column(f"'{path}'"),
+        func.coalesce(items, literal_column("'[]'::jsonb")),
+    )
+
+
+def _recommendation_nodes() -> ColumnElement[Any]:
+    node = func.jsonb_build_object(
+        literal_column("'id'"),
+        MediaRecommendation.recommendation_id,
+        literal_column("'rating'"),
+        MediaRecommendation.rating,
+        literal_column("'mediaRecommendation'"),
+        MediaNode.content,
+    )
+    ordered = aggregate_order_by(node, col(MediaRecommendation.position))
+    return (
+        select(func.jsonb_agg(ordered))
+        .join_from(
+            MediaRecommendation,
+            MediaNode,
+            col(MediaRecommendation.recommended_id) == MediaNode.id,
+        )
+        .where(col(MediaRecommendation.media_id) == MediaFile.id)
+        .scalar_subquery()
+    )
+
+
+def _relation_edges() -> ColumnElement[Any]:
+    edge = func.jsonb_build_object(
+        literal_column("'relationType'"),
+        MediaRelation.relation_type,
+        literal_column("'node'"),
+        MediaNode.content,
+    )
+    ordered = aggregate_order_by(edge, col(MediaRelation.position))
+    return (
+        select(func.jsonb_agg(ordered))
+        .join_from(
+            MediaRelation,
+            MediaNode,
+            col(MediaRelation.related_id) == MediaNode.id,
+        )
+        .where(col(MediaRelation.media_id) == MediaFile.id)
+        .scalar_subquery()
+    )
+
+
+def media_content() -> ColumnElement[str]:
+    """``MediaFile.content`` with its recommendations and relations put back."""
+    content = _embed(
+        MediaFile.content,  # type: ignore[arg-type]
+        "{recommendations,nodes}",
+        _recommendation_nodes(),
+    )
+    content = _embed(content, "{relations,edges}", _relation_edges())
+    return cast(content, Text)
+
+
+def media_json(session: Session, media_ids: Iterable[int]) -> dict[int, str]:
+    """Response JSON of each cached media in ``media_ids``."""
+    statement = select(MediaFile.id, media_content()).where(
+        col(MediaFile.id).in_(list(media_ids)),
+    )
+    return dict(session.exec(statement).all())
@@ -49,6 +49,9 @@ class MediaListGroup(BaseModel):
         None, description="Media list entries"
     )
     status: MediaListStatus | None = None
+    type: MediaType | None = Field(
+        None, description="Whether the list is of anime or manga"
+    )
 
 
 class MediaListCollection(BaseModel):
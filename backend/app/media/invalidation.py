@@ -0,0 +1,123 @@
+"""Tell every worker when a cached entry changes, through Postgres NOTIFY."""
+
+import logging
+import selectors
+import socket
+import threading
+from collections.abc import Callable
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import Engine
+from sqlmodel import Session, func, select
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "anilist_cache"
+# Sent instead of keys too long for a NOTIFY payload: listeners drop everything.
+RESET = "*"
+_MAX_PAYLOAD_BYTES = 7999
+
+
+def publish(session: Session, key: str) -> None:
+    """Announce that ``key`` changed, once the session's transaction commits.
+
+    Postgres holds the notification back until then, and drops it if the
+    transaction rolls back.
+    """
+    payload = key if len(key.encode()) <= _MAX_PAYLOAD_BYTES else RESET
+    session.exec(select(func.pg_notify(CHANNEL, payload)))
+
+
+def connect_listener(engine: Engine) -> psycopg.Connection:
+    """A connection of its own, outside ``engine``'s pool, to listen on."""
+    return psycopg.connect(
+        **engine.url.translate_connect_args(username="user", database="dbname"),
+        autocommit=True,
+    )
+
+
+class InvalidationListener:
+    """Calls ``on_change`` with every key published, by any process.
+
+    Listens on its own connection in a daemon thread, reconnecting after
+    ``retry_interval`` seconds if it is lost. Changes published while nobody
+    was listening are missed, so ``on_reset`` is called on every (re)connect,
+    and for keys too long to be sent.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], psycopg.Connection],
+        on_change: Callable[[str], None],
+        on_reset: Callable[[], None],
+        retry_interval: float = 5.0,
+    ) -> None:
+        self._connect = connect
+        self._on_change = on_change
+        self._on_reset = on_reset
+        self._retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Written to by stop() to wake the thread up while it waits.
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.settimeout(0)
+
+    def start(self) -> None:
+        """Start listening; does nothing if already running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._drain_wake_ups()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="anilist-cache-invalidation",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop listening and wait up to ``timeout`` for the thread to end."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopped.set()
+        self._wake_writer.send(b"\0")
+        thread.join(timeout)
+
+    def _drain_wake_ups(self) -> None:
+        try:
+            while self._wake_reader.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with self._connect() as connection:
+                    connection.execute(
+                        sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)),
+                    )
+                    self._on_reset()
+                    self._listen(connection)
+            except psycopg.Error:
+                logger.exception("Cache invalidation listener lost its connection")
+                self._stopped.wait(self._retry_interval)
+
+    def _listen(self, connection: psycopg.Connection) -> None:
+        with selectors.DefaultSelector() as selector:
+            selector.register(connection, selectors.EVENT_READ)
+            selector.register(self._wake_reader, selectors.EVENT_READ)
+            while not self._stopped.is_set():
+                events = selector.select()
+                if not any(key.fileobj is connection for key, _ in events):
+                    continue
+                for notify in connection.notifies(timeout=0):
+                    if notify.payload == RESET:
+                        self._on_reset()
+                    else:
+                        self._on_change(notify.payload)
@@ -2,13 +2,48 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlmodel import DateTime, Field, SQLModel
+from sqlalchemy import BindParameter, ColumnElement, LargeBinary, Text, cast, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import UserDefinedType
+from sqlmodel import DateTime, Field, Index, SQLModel
 
 from app.utils import tz_datetime
 
 SA_TYPE = DateTime(timezone=True)
 
 
+class JsonText(UserDefinedType[str]):
+    """JSON stored as JSONB but read and written as its text.
+
+    Cached payloads are saved and served as JSON strings without being parsed
+    in Python, while Postgres can still index and query inside them.
+    """
+
+    cache_ok = True
+
+    def get_col_spec(self, **_: object) -> str:
+        return "JSONB"
+
+    def bind_expression(self, bindvalue: BindParameter[str]) -> ColumnElement[str]:
+        return cast(bindvalue, JSONB)
+
+    def column_expression(self, colexpr: ColumnElement[str]) -> ColumnElement[str]:
+        return cast(colexpr, Text)
+
+
+JSON_TYPE = JsonText()
+
+
+def _content_gin_index(table: str) -> Index:
+    """Index for ``content @> ...`` containment queries, e.g. on type or status."""
+    return Index(
+        f"ix_{table}_content",
+        "content",
+        postgresql_using="gin",
+        postgresql_ops={"content": "jsonb_path_ops"},
+    )
+
+
 class BaseMetadataMixin(SQLModel):
     """Mixin to add created_at and modified_at fields to a model."""
 
@@ -28,20 +63,108 @@ class BaseMetadataMixin(SQLModel):
     )
 
     data_timestamp: datetime | None = Field(sa_type=SA_TYPE, default=None)  #  type: ignore[call-overload]
+    # When the data is due for a refresh, as decided by the table's TTL policy.
     update_at: datetime | None = Field(sa_type=SA_TYPE, default=None)  # type: ignore[call-overload]
     deleted_at: datetime | None = Field(sa_type=SA_TYPE, default=None)  # type: ignore[call-overload]
 
 
 class MediaFile(BaseMetadataMixin, table=True):
+    __table_args__ = (
+        # The background refresh scans for media close to expiring.
+        Index("ix_mediafile_update_at", "update_at"),
+        _content_gin_index("mediafile"),
+        Index(
+            "ix_mediafile_start_year",
+            # As Postgres normalises it, so autogenerate sees no difference.
+            text("((content #>> '{startDate,year}'::text[])::integer)"),
+        ),
+        Index("ix_mediafile_popularity", text("((content ->> 'popularity')::integer)")),
+    )
+
     id: int = Field(primary_key=True)
-    content: str = Field()
+    content: str = Field(sa_type=JSON_TYPE)  # type: ignore[call-overload]
+    # The media's updatedAt on AniList (epoch seconds) when content was fetched.
+    anilist_updated_at: int | None = Field(default=None)
+    # When content was last downloaded in full rather than probed unchanged.
+    full_sync_at: datetime | None = Field(sa_type=SA_TYPE, default=None)  # type: ignore[call-overload]
 
 
 class UserFile(BaseMetadataMixin, table=True):
+    __table_args__ = (_content_gin_index("userfile"),)
+
     id: str = Field(primary_key=True)
-    content: str = Field()
+    # How the list is stored: "json" in content, or "zstd" in
+    # compressed_content, with the PayloadDictionary dictionary_id if any.
+    content_format: str = Field(default="json")
+    content: str | None = Field(sa_type=JSON_TYPE, default=None)  # type: ignore[call-overload]
+    compressed_content: bytes | None = Field(sa_type=LargeBinary, default=None)  # type: ignore[call-overload]
+    dictionary_id: int | None = Field(default=None)
+    # Newest entry updatedAt (AniList epoch seconds) in content. Refreshes only
+    # fetch entries updated since, until a full sync is due again.
+    list_updated_at: int | None = Field(default=None)
+    full_sync_at: datetime | None = Field(sa_type=SA_TYPE, default=None)  # type: ignore[call-overload]
 
 
 class SearchFile(BaseMetadataMixin, table=True):
+    __table_args__ = (_content_gin_index("searchfile"),)
+
     search_query: str = Field(primary_key=True)
-    content: str = Field()
+    content: str = Field(sa_type=JSON_TYPE)  # type: ignore[call-overload]
+
+
+class RateLimitState(SQLModel, table=True):
+    """Shared AniList rate limit budget, coordinated across processes."""
+
+    name: str = Field(primary_key=True)
+    next_request_at: datetime = Field(sa_type=SA_TYPE)  # type: ignore[call-overload]
+    min_interval: float = Field()
+    # Token bucket mode: tokens left as of refilled_at.
+    tokens: float = Field(default=0)
+    refilled_at: datetime = Field(sa_type=SA_TYPE, default_factory=tz_datetime.now)  # type: ignore[call-overload]
+
+
+class NegativeCacheEntry(SQLModel, table=True):
+    """Something AniList doesn't have or won't show, remembered for a while."""
+
+    key: str = Field(primary_key=True)
+    status_code: int = Field()
+    detail: str = Field()
+    expires_at: datetime = Field(sa_type=SA_TYPE)  # type: ignore[call-overload]
+
+
+class MediaNode(SQLModel, table=True):
+    """A recommended or related media, stored once however many link to it."""
+
+    id: int = Field(primary_key=True)
+    content: str = Field(sa_type=JSON_TYPE)  # type: ignore[call-overload]
+    data_timestamp: datetime | None = Field(sa_type=SA_TYPE, default=None)  # type: ignore[call-overload]
+
+
+class MediaRecommendation(SQLModel, table=True):
+    __table_args__ = (Index("ix_mediarecommendation_recommended_id", "recommended_id"),)
+
+    media_id: int = Field(primary_key=True)
+    recommended_id: int = Field(primary_key=True)
+    # The AniList recommendation's own id.
+    recommendation_id: int
+    rating: int | None = Field(default=None)
+    # Order within the media's recommendations, best rated first.
+    position: int
+
+
+class MediaRelation(SQLModel, table=True):
+    __table_args__ = (Index("ix_mediarelation_related_id", "related_id"),)
+
+    media_id: int = Field(primary_key=True)
+    related_id: int = Field(primary_key=True)
+    relation_type: str | None = Field(default=None)
+    position: int
+
+
+class PayloadDictionary(SQLModel, table=True):
+    """A zstd dictionary trained on the cached payloads of one table."""
+
+    id: int | None = Field(default=None, primary_key=True)
+    table_name: str = Field(index=True)
+    content: bytes = Field(sa_type=LargeBinary)  # type: ignore[call-overload]
+    created_at: datetime = Field(sa_type=SA_TYPE, default_factory=tz_datetime.now)  # type: ignore[call-overload]
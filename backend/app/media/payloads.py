@@ -0,0 +1,111 @@
+"""Optional zstd compression of cached user lists.
+
+Lists are stored as JSONB unless ANILIST_USER_LIST_COMPRESSION is "zstd".
+They are then compressed with the newest dictionary trained on cached lists
+(see ``python -m app.media.train_dictionary``), or none before one is
+trained. Each row records its format and dictionary, so lists stored before
+either changed are still read, and converted on their next refresh.
+"""
+
+import threading
+from collections.abc import Iterable
+from compression import zstd
+
+from sqlmodel import Session, func, select
+
+from app.config import settings
+from app.media.models import PayloadDictionary, UserFile
+
+USER_LIST_TABLE = "userfile"
+
+# Dictionaries never change once stored, so each worker loads them once.
+_dictionaries: dict[int, zstd.ZstdDict] = {}
+_dictionaries_lock = threading.Lock()
+
+
+def _dictionary(session: Session, dictionary_id: int) -> zstd.ZstdDict:
+    with _dictionaries_lock:
+        zstd_dict = _dictionaries.get(dictionary_id)
+    if zstd_dict is None:
+        stored = session.get(PayloadDictionary, dictionary_id)
+        if stored is None:
+            msg = f"Compression dictionary {dictionary_id} not found"
+            raise LookupError(msg)
+        zstd_dict = zstd.ZstdDict(stored.content)
+        with _dictionaries_lock:
+            _dictionaries[dictionary_id] = zstd_dict
+    return zstd_dict
+
+
+def _latest_dictionary_id(session: Session, table_name: str) -> int | None:
+    statement = select(func.max(PayloadDictionary.id)).where(
+        PayloadDictionary.table_name == table_name,
+    )
+    return session.exec(statement).one()
+
+
+def store_user_list(session: Session, user_file: UserFile, content: str) -> None:
+    """Set the cached list of ``user_file`` in the configured format."""
+    if settings.ANILIST_USER_LIST_COMPRESSION != "zstd":
+        user_file.content_format = "json"
+        user_file.content = content
+        user_file.compressed_content = None
+        user_file.dictionary_id = None
+        return
+
+    dictionary_id = _latest_dictionary_id(session, USER_LIST_TABLE)
+    zstd_dict = (
+        _dictionary(session, dictionary_id).as_digested_dict
+        if dictionary_id is not None
+        else None
+    )
+    user_file.content_format = "zstd"
+    user_file.content = None
+    user_file.compressed_content = zstd.compress(
+        content.encode(),
+        level=settings.ANILIST_USER_LIST_COMPRESSION_LEVEL,
+        zstd_dict=zstd_dict,
+    )
+    user_file.dictionary_id = dictionary_id
+
+
+def load_user_list(session: Session, user_file: UserFile) -> str | bytes:
+    """The cached list of ``user_file`` as JSON.
+
+    Compressed lists are returned as the decompressed bytes, ready to be sent
+    without decoding them.
+    """
+    if user_file.content_format != "zstd":
+        if user_file.content is None:
+            msg = f"User list {user_file.id!r} has no content"
+            raise ValueError(msg)
+        return user_file.content
+    if user_file.compressed_content is None:
+        msg = f"User list {user_file.id!r} has no compressed content"
+        raise ValueError(msg)
+    zstd_dict = (
+        _dictionary(session, user_file.dictionary_id).as_undigested_dict
+        if user_file.dictionary_id is not None
+        else None
+    )
+    return zstd.decompress(user_file.compressed_content, zstd_dict=zstd_dict)
+
+
+def train_dictionary(
+    session: Session,
+    samples: Iterable[bytes],
+    size: int,
+    table_name: str = USER_LIST_TABLE,
+) -> PayloadDictionary:
+    """Train a dictionary on ``samples`` and store it as the newest for the table.
+
+    Nothing is committed.
+    """
+    zstd_dict = zstd.train_dict(list(samples), size)
+    dictionary = PayloadDictionary(
+        table_name=table_name,
+        content=zstd_dict.dict_content,
+    )
+    session.add(dictionary)
+    session.flush()
+    return dictionary
@@ -1,10 +1,17 @@
-MEDIA_QUERY = """query($mediaId: Int) {
-  Media(id: $mediaId) {
+from app.config import settings
+
+# Selection set shared by the single and batched media queries. Neighbouring
+# media only get NeighborFields; their full details come from their own query.
+MEDIA_SELECTION = """
     ...MediaFields
-    recommendations {
+    recommendations(sort: RATING_DESC, perPage: 25) {
+      pageInfo {
+        hasNextPage
+        lastPage
+      }
       nodes {
         mediaRecommendation {
-          ...MediaFields
+          ...NeighborFields
         }
         id
         rating
@@ -14,14 +21,13 @@ MEDIA_QUERY = """query($mediaId: Int) {
       edges {
         relationType
         node {
-          ...MediaFields
+          ...NeighborFields
         }
       }
     }
-  }
-}
+"""
 
-fragment MediaFields on Media {
+MEDIA_FIELDS = """
   id
   title {
     romaji
@@ -120,16 +126,202 @@ fragment MediaFields on Media {
     isDisabled
   }
   isLicensed
+"""
+
+# What the graph and its tooltips need to draw a neighbouring media.
+NEIGHBOR_FIELDS = """
+  id
+  title {
+    romaji
+    english
+    native
+  }
+  averageScore
+  chapters
+  coverImage {
+    medium
+    color
+  }
+  episodes
+  format
+  genres
+  idMal
+  popularity
+  siteUrl
+  startDate {
+    year
+  }
+  status
+  tags {
+    name
+    rank
+  }
+  type
+"""
+
+# Fields selected for recommendation and relation nodes, by
+# ANILIST_NEIGHBOR_PROFILE. "full" selects everything, as for the media itself.
+NEIGHBOR_PROFILES = {
+    "slim": NEIGHBOR_FIELDS,
+    "full": MEDIA_FIELDS,
+}
+
+NEIGHBOR_FIELDS_FRAGMENT = (
+    "\nfragment NeighborFields on Media {"
+    + NEIGHBOR_PROFILES[settings.ANILIST_NEIGHBOR_PROFILE]
+    + "}\n"
+)
+
+MEDIA_FIELDS_FRAGMENT = (
+    "\nfragment MediaFields on Media {"
+    + MEDIA_FIELDS
+    + "}\n"
+    + NEIGHBOR_FIELDS_FRAGMENT
+)
+
+MEDIA_QUERY = (
+    """query($mediaId: Int) {
+  Media(id: $mediaId) {"""
+    + MEDIA_SELECTION
+    + """  }
 }
 """
+    + MEDIA_FIELDS_FRAGMENT
+)
+
+# Rough AniList query complexity of one MEDIA_SELECTION, used to size batches.
+MEDIA_QUERY_COMPLEXITY = 50
+
+
+def media_batch_size() -> int:
+    """How many media fit in one batched query under the complexity limit."""
+    return max(1, settings.ANILIST_MAX_QUERY_COMPLEXITY // MEDIA_QUERY_COMPLEXITY)
 
-USER_QUERY = """query($userName: String, $type: MediaType) {
-  MediaListCollection(userName: $userName, type: $type) {
-    lists {
-      entries {
+
+def build_media_batch_query(media_ids: list[int]) -> tuple[str, dict[str, int | str]]:
+    """Build one query fetching every media in ``media_ids`` under its own alias.
+
+    Each media is selected as ``media<index>`` with its id passed as the
+    ``$id<index>`` variable; results are matched back by their ``id`` field.
+    """
+    parameters = ", ".join(f"$id{index}: Int" for index in range(len(media_ids)))
+    selections = "".join(
+        f"  media{index}: Media(id: $id{index}) {{{MEDIA_SELECTION}  }}\n"
+        for index in range(len(media_ids))
+    )
+    query = f"query({parameters}) {{\n{selections}}}\n{MEDIA_FIELDS_FRAGMENT}"
+    variables: dict[str, int | str] = {
+        f"id{index}": media_id for index, media_id in enumerate(media_ids)
+    }
+    return query, variables
+
+
+# Media whose updatedAt is checked per request; AniList's maximum page size.
+MEDIA_PROBE_BATCH_SIZE = 50
+
+MEDIA_UPDATES_QUERY = """query($ids: [Int], $perPage: Int) {
+  Page(perPage: $perPage) {
+    media(id_in: $ids) {
+      id
+      updatedAt
+    }
+  }
+}"""
+
+# Recommendations come highest rated first, this many to a page (as in
+# MEDIA_SELECTION).
+RECOMMENDATIONS_PER_PAGE = 25
+# Rough AniList query complexity of one page of recommendations.
+RECOMMENDATION_PAGE_COMPLEXITY = 25
+
+
+def recommendation_pages_per_query() -> int:
+    """How many recommendation pages fit in one query under the complexity limit."""
+    return max(
+        1,
+        settings.ANILIST_MAX_QUERY_COMPLEXITY // RECOMMENDATION_PAGE_COMPLEXITY,
+    )
+
+
+def build_recommendation_pages_query(
+    pages: list[tuple[int, int]],
+) -> tuple[str, dict[str, int | str]]:
+    """Build one query fetching each ``(media id, page)`` of recommendations.
+
+    Pages are selected as ``page<index>`` in the order given, with the media id
+    and page number passed as ``$id<index>`` and ``$page<index>``.
+    """
+    parameters = ", ".join(
+        f"$id{index}: Int, $page{index}: Int" for index in range(len(pages))
+    )
+    selections = "".join(
+        f"""  page{index}: Media(id: $id{index}) {{
+    recommendations(sort: RATING_DESC, page: $page{index}, perPage: {RECOMMENDATIONS_PER_PAGE}) {{
+      nodes {{
+        mediaRecommendation {{
+          ...NeighborFields
+        }}
+        id
+        rating
+      }}
+    }}
+  }}
+"""
+        for index in range(len(pages))
+    )
+    query = f"query({parameters}) {{\n{selections}}}\n{NEIGHBOR_FIELDS_FRAGMENT}"
+    variables: dict[str, int | str] = {}
+    for index, (media_id, page) in enumerate(pages):
+        variables[f"id{index}"] = media_id
+        variables[f"page{index}"] = page
+    return query, variables
+
+
+USER_LIST_TYPES = ("ANIME", "MANGA")
+# Entries per MediaListCollection chunk; AniList's maximum.
+USER_LIST_CHUNK_SIZE = 500
+
+
+def build_user_lists_query(media_types: list[str]) -> str:
+    """Build one query fetching a chunk of a user's list of each media type.
+
+    Each list is selected under its lowercased type, e.g. ``anime``, and they
+    share the ``$userName``, ``$chunk`` and ``$perChunk`` variables.
+    """
+    selections = "".join(
+        f"""  {media_type.lower()}: MediaListCollection(
+    userName: $userName, type: {media_type}, chunk: $chunk, perChunk: $perChunk
+  ) {{
+    hasNextChunk
+    lists {{
+      entries {{
         mediaId
-      }
+        updatedAt
+      }}
+      status
+    }}
+  }}
+"""
+        for media_type in media_types
+    )
+    return f"query($userName: String, $chunk: Int, $perChunk: Int) {{\n{selections}}}"
+
+
+# Entries per page of list updates.
+USER_LIST_UPDATES_PER_PAGE = 50
+
+USER_LIST_UPDATES_QUERY = """query($userName: String, $page: Int, $perPage: Int) {
+  Page(page: $page, perPage: $perPage) {
+    pageInfo {
+      hasNextPage
+    }
+    mediaList(userName: $userName, sort: UPDATED_TIME_DESC) {
+      mediaId
       status
+      updatedAt
+      media {
+        type
+      }
     }
   }
 }"""
@@ -166,3 +358,20 @@ SEARCH_QUERY = """query($search: String, $page: Int, $perPage: Int, $type: Media
     }
   }
 }"""
+
+# Ids of the most popular, trending or current-season media for the cache
+# warm-up, a page of AniList's maximum size at a time.
+WARM_UP_PER_PAGE = 50
+
+WARM_UP_QUERY = """query(
+  $page: Int, $perPage: Int, $sort: [MediaSort], $season: MediaSeason, $seasonYear: Int
+) {
+  Page(page: $page, perPage: $perPage) {
+    pageInfo {
+      hasNextPage
+    }
+    media(sort: $sort, season: $season, seasonYear: $seasonYear, isAdult: false) {
+      id
+    }
+  }
+}"""
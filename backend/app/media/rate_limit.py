@@ -0,0 +1,439 @@
+"""Rate limiters that keep AniList requests within the API rate limit."""
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import (
+    ColumnElement,
+    Engine,
+    Executable,
+    SQLColumnExpression,
+    create_engine,
+    func,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import col
+
+from app.config import settings
+from app.media.models import RateLimitState
+
+logger = logging.getLogger(__name__)
+
+# The shared limiters get a pool of their own: request threads waiting for a
+# slot already hold a connection from the main pool each, so under load they
+# would otherwise wait on each other for the pool timeout.
+rate_limit_engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    pool_size=2,
+    max_overflow=8,
+    pool_timeout=5,
+)
+
+
+class RateLimiter(ABC):
+    """Spaces and backs off AniList requests to respect the API rate limit.
+
+    A single shared instance is used by every request so concurrent callers are
+    throttled together rather than each tracking their own budget.
+    """
+
+    @abstractmethod
+    def reserve_slot(self) -> None:
+        """Block until the caller is allowed to issue the next request."""
+
+    @abstractmethod
+    def apply_cooldown(self, seconds: float) -> None:
+        """Delay all subsequent requests by ``seconds`` (a hard backoff)."""
+
+    @abstractmethod
+    def set_limit(self, requests_per_minute: int) -> None:
+        """Space requests so no more than ``requests_per_minute`` are sent."""
+
+    def limit_remaining(self, remaining: int, reset_at: float | None) -> None:
+        """Account for AniList reporting ``remaining`` requests left this window.
+
+        ``reset_at`` is the POSIX time the window resets, when AniList sends it.
+        By default this only holds off requests once the window is drained so we
+        don't deliberately walk into a 429.
+        """
+        if remaining <= 0 and reset_at is not None:
+            self.apply_cooldown(reset_at - time.time())
+
+    def learn_limit(self, headers: httpx.Headers) -> None:
+        """Tighten request spacing from the X-RateLimit-Limit header."""
+        limit = _int_header(headers, "X-RateLimit-Limit")
+        if limit is None or limit <= 0:
+            return
+        self.set_limit(limit)
+
+    def learn_remaining(self, headers: httpx.Headers) -> None:
+        """Track the budget left from the X-RateLimit-Remaining header."""
+        remaining = _int_header(headers, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        raw_reset = headers.get("X-RateLimit-Reset")
+        try:
+            reset_at = float(raw_reset) if raw_reset is not None else None
+        except ValueError:
+            reset_at = None
+        self.limit_remaining(remaining, reset_at)
+
+
+def _int_header(headers: httpx.Headers, name: str) -> int | None:
+    raw_value = headers.get(name)
+    if raw_value is None:
+        return None
+    try:
+        return int(raw_value)
+    except ValueError:
+        return None
+
+
+class LocalRateLimiter(RateLimiter):
+    """Rate limiter whose budget only covers the current process."""
+
+    def __init__(self, requests_per_minute: int) -> None:
+        self._lock = threading.Lock()
+        # Minimum seconds between consecutive requests.
+        self._min_interval = 60.0 / requests_per_minute
+        # Earliest monotonic-clock time at which the next request may be sent.
+        self._next_request_at = 0.0
+
+    def reserve_slot(self) -> None:
+        """Block until the caller is allowed to issue the next request.
+
+        Spaces requests by the observed rate limit so concurrent callers (e.g. a
+        relations traversal fetching many media at once) don't burst past the
+        cap.
+        """
+        with self._lock:
+            start_at = max(time.monotonic(), self._next_request_at)
+            self._next_request_at = start_at + self._min_interval
+
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def apply_cooldown(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._next_request_at = max(
+                self._next_request_at,
+                time.monotonic() + seconds,
+            )
+
+    def set_limit(self, requests_per_minute: int) -> None:
+        with self._lock:
+            self._min_interval = 60.0 / requests_per_minute
+
+
+class LocalTokenBucketRateLimiter(RateLimiter):
+    """Process-local token bucket that bursts while AniList reports budget left.
+
+    The bucket holds up to a minute's worth of requests, less a safety margin,
+    and refills at the rate limit. Each AniList response caps the bucket at the
+    ``X-RateLimit-Remaining`` it reports, so bursts never outrun the server's
+    own count. Tokens go negative while requests wait for a refill.
+    """
+
+    def __init__(self, requests_per_minute: int, safety_margin: int) -> None:
+        self._lock = threading.Lock()
+        self._safety_margin = safety_margin
+        self._rate = requests_per_minute / 60.0
+        self._capacity = max(1.0, requests_per_minute - safety_margin)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        # Monotonic-clock time before which no request may be sent (cooldowns).
+        self._blocked_until = 0.0
+
+    def reserve_slot(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = max(-self._tokens / self._rate, self._blocked_until - now)
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def apply_cooldown(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._blocked_until = max(
+                self._blocked_until,
+                time.monotonic() + seconds,
+            )
+
+    def set_limit(self, requests_per_minute: int) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = requests_per_minute / 60.0
+            self._capacity = max(1.0, requests_per_minute - self._safety_margin)
+            self._tokens = min(self._tokens, self._capacity)
+
+    def limit_remaining(self, remaining: int, reset_at: float | None) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, remaining - self._safety_margin)
+        super().limit_remaining(remaining, reset_at)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._refilled_at = now
+
+
+def _seconds(value: float | SQLColumnExpression[float]) -> ColumnElement[timedelta]:
+    """SQL interval of ``value`` seconds."""
+    return func.make_interval(0, 0, 0, 0, 0, 0, value)
+
+
+_next_request_at_column = col(RateLimitState.next_request_at)
+_min_interval_column = col(RateLimitState.min_interval)
+_tokens_column = col(RateLimitState.tokens)
+_refilled_at_column = col(RateLimitState.refilled_at)
+
+
+class PostgresRateLimiter(RateLimiter):
+    """Rate limiter whose budget is shared through a row in Postgres.
+
+    Every worker and replica reserves slots by atomically advancing the same
+    ``ratelimitstate`` row, so they all draw from one budget. The row outlives
+    the process, so a restart does not reset pending spacing or cooldowns.
+    Timestamps come from the database clock so hosts with skewed clocks agree.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        db_engine: Engine = rate_limit_engine,
+        name: str = "anilist",
+    ) -> None:
+        self._engine = db_engine
+        self._name = name
+        self._default_interval = 60.0 / requests_per_minute
+        self._known_limit = requests_per_minute
+        # Used while the database is unreachable so requests are still spaced.
+        self._fallback: RateLimiter = LocalRateLimiter(requests_per_minute)
+
+    def reserve_slot(self) -> None:
+        now = func.clock_timestamp()
+        statement = (
+            insert(RateLimitState)
+            .values(
+                name=self._name,
+                next_request_at=now + _seconds(self._default_interval),
+                min_interval=self._default_interval,
+            )
+            .on_conflict_do_update(
+                index_elements=[col(RateLimitState.name)],
+                set_={
+                    "next_request_at": func.greatest(_next_request_at_column, now)
+                    + _seconds(_min_interval_column),
+                },
+            )
+            .returning(
+                func.extract(
+                    "epoch",
+                    _next_request_at_column - _seconds(_min_interval_column) - now,
+                ),
+            )
+        )
+        self._reserve(statement)
+
+    def _reserve(self, statement: Executable) -> None:
+        """Run a reservation returning the delay in seconds, then wait it out."""
+        try:
+            with self._engine.begin() as connection:
+                delay = float(connection.execute(statement).scalar_one())
+        except SQLAlchemyError:
+            logger.exception("Shared rate limiter unavailable; using local spacing")
+            self._fallback.reserve_slot()
+            return
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def apply_cooldown(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        self._fallback.apply_cooldown(seconds)
+
+        resume_at = func.clock_timestamp() + _seconds(seconds)
+        statement = (
+            insert(RateLimitState)
+            .values(
+                name=self._name,
+                next_request_at=resume_at,
+                min_interval=self._default_interval,
+            )
+            .on_conflict_do_update(
+                index_elements=[col(RateLimitState.name)],
+                set_={
+                    "next_request_at": func.greatest(
+                        _next_request_at_column,
+                        resume_at,
+                    ),
+                },
+            )
+        )
+        self._execute(statement)
+
+    def set_limit(self, requests_per_minute: int) -> None:
+        # Every response carries the limit, so only write when it changes.
+        if requests_per_minute == self._known_limit:
+            return
+        self._known_limit = requests_per_minute
+        self._fallback.set_limit(requests_per_minute)
+
+        min_interval = 60.0 / requests_per_minute
+        statement = (
+            insert(RateLimitState)
+            .values(
+                name=self._name,
+                next_request_at=func.clock_timestamp(),
+                min_interval=min_interval,
+            )
+            .on_conflict_do_update(
+                index_elements=[col(RateLimitState.name)],
+                set_={"min_interval": min_interval},
+                where=_min_interval_column != min_interval,
+            )
+        )
+        self._execute(statement)
+
+    def _execute(self, statement: Executable) -> None:
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(statement)
+        except SQLAlchemyError:
+            logger.exception("Failed to update shared rate limiter state")
+
+
+class PostgresTokenBucketRateLimiter(PostgresRateLimiter):
+    """Token bucket variant of :class:`PostgresRateLimiter`.
+
+    Works like :class:`LocalTokenBucketRateLimiter`, with the bucket kept in the
+    shared ``ratelimitstate`` row. ``next_request_at`` only holds cooldowns.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        safety_margin: int,
+        db_engine: Engine = rate_limit_engine,
+        name: str = "anilist",
+    ) -> None:
+        super().__init__(requests_per_minute, db_engine, name)
+        self._safety_margin = safety_margin
+        self._fallback = LocalTokenBucketRateLimiter(
+            requests_per_minute,
+            safety_margin,
+        )
+
+    def _refilled_tokens(self, now: ColumnElement[datetime]) -> ColumnElement[float]:
+        """The row's token count topped up for the time since its last refill."""
+        capacity = func.greatest(1.0, 60.0 / _min_interval_column - self._safety_margin)
+        elapsed = func.extract("epoch", now - _refilled_at_column)
+        return func.least(capacity, _tokens_column + elapsed / _min_interval_column)
+
+    def reserve_slot(self) -> None:
+        now = func.clock_timestamp()
+        capacity = max(1.0, 60.0 / self._default_interval - self._safety_margin)
+        statement = (
+            insert(RateLimitState)
+            .values(
+                name=self._name,
+                next_request_at=now,
+                min_interval=self._default_interval,
+                tokens=capacity - 1,
+                refilled_at=now,
+            )
+            .on_conflict_do_update(
+                index_elements=[col(RateLimitState.name)],
+                set_={
+                    "tokens": self._refilled_tokens(now) - 1,
+                    "refilled_at": now,
+                },
+            )
+            .returning(
+                func.greatest(
+                    -_tokens_column * _min_interval_column,
+                    func.extract("epoch", _next_request_at_column - now),
+                ),
+            )
+        )
+        self._reserve(statement)
+
+    def limit_remaining(self, remaining: int, reset_at: float | None) -> None:
+        self._fallback.limit_remaining(remaining, reset_at)
+
+        now = func.clock_timestamp()
+        statement = (
+            update(RateLimitState)
+            .where(col(RateLimitState.name) == self._name)
+            .values(
+                tokens=func.least(
+                    self._refilled_tokens(now),
+                    remaining - self._safety_margin,
+                ),
+                refilled_at=now,
+            )
+        )
+        self._execute(statement)
+        if remaining <= 0 and reset_at is not None:
+            self.apply_cooldown(reset_at - time.time())
+
+
+class CappedRateLimiter(RateLimiter):
+    """Caps this process's own request rate while drawing on another budget.
+
+    Lets bulk jobs such as the cache warm-up share AniList with live traffic
+    without using up the whole shared budget.
+    """
+
+    def __init__(self, rate_limiter: RateLimiter, requests_per_minute: int) -> None:
+        self._rate_limiter = rate_limiter
+        self._cap = LocalRateLimiter(requests_per_minute)
+
+    def reserve_slot(self) -> None:
+        self._cap.reserve_slot()
+        self._rate_limiter.reserve_slot()
+
+    def apply_cooldown(self, seconds: float) -> None:
+        self._rate_limiter.apply_cooldown(seconds)
+
+    def set_limit(self, requests_per_minute: int) -> None:
+        self._rate_limiter.set_limit(requests_per_minute)
+
+    def limit_remaining(self, remaining: int, reset_at: float | None) -> None:
+        self._rate_limiter.limit_remaining(remaining, reset_at)
+
+
+def _create_shared_rate_limiter(requests_per_minute: int) -> RateLimiter:
+    safety_margin = settings.ANILIST_RATE_LIMIT_SAFETY_MARGIN
+    token_bucket = settings.ANILIST_RATE_LIMIT_MODE == "token_bucket"
+    if settings.ANILIST_RATE_LIMITER == "postgres":
+        if token_bucket:
+            return PostgresTokenBucketRateLimiter(requests_per_minute, safety_margin)
+        return PostgresRateLimiter(requests_per_minute)
+    if token_bucket:
+        return LocalTokenBucketRateLimiter(requests_per_minute, safety_margin)
+    return LocalRateLimiter(requests_per_minute)
+
+
+def create_rate_limiter(requests_per_minute: int) -> RateLimiter:
+    """Build the rate limiter selected by the ANILIST_RATE_LIMIT* settings."""
+    rate_limiter = _create_shared_rate_limiter(requests_per_minute)
+    process_limit = settings.ANILIST_PROCESS_MAX_REQUESTS_PER_MINUTE
+    if process_limit is not None:
+        return CappedRateLimiter(rate_limiter, process_limit)
+    return rate_limiter
@@ -0,0 +1,67 @@
+"""Keep cached AniList data fresh from a background thread."""
+
+import logging
+import random
+import threading
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicRefresher:
+    """Calls ``refresh`` every ``interval`` seconds in a daemon thread.
+
+    Each wait is jittered by up to ``jitter`` of the interval so workers started
+    together drift apart. Failures are logged and retried on the next run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        refresh: Callable[[], object],
+        interval: float,
+        jitter: float = 0.2,
+    ) -> None:
+        self._name = name
+        self._refresh = refresh
+        self._interval = interval
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start refreshing; does nothing if already running or interval <= 0."""
+        with self._lock:
+            if self._interval <= 0 or self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name=self._name,
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop refreshing and wait up to ``timeout`` for a running refresh."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopped.set()
+        thread.join(timeout)
+
+    def run_once(self) -> None:
+        try:
+            self._refresh()
+        except Exception:
+            logger.exception("Background refresh %r failed", self._name)
+
+    def _next_delay(self) -> float:
+        spread = self._interval * self._jitter
+        return self._interval + random.uniform(-spread, spread)  # noqa: S311
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._next_delay()):
+            self.run_once()
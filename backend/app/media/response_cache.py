@@ -0,0 +1,156 @@
+"""Per-worker cache of ready-to-send responses, in front of the database."""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+# Rough bookkeeping cost of an entry beyond its key and body.
+_ENTRY_OVERHEAD = 128
+
+
+class _FrequencySketch:
+    """Approximate recent access counts of keys, in constant memory.
+
+    A count-min sketch of small saturating counters. Every ``sample_size``
+    increments all counters are halved, so keys popular long ago fade.
+    """
+
+    _DEPTH = 4
+    _MAX_COUNT = 15
+
+    def __init__(self, width: int, sample_size: int) -> None:
+        self._width = width
+        self._sample_size = sample_size
+        self._counters = [bytearray(width) for _ in range(self._DEPTH)]
+        self._increments = 0
+
+    def _indexes(self, key: str) -> list[int]:
+        return [hash((seed, key)) % self._width for seed in range(self._DEPTH)]
+
+    def increment(self, key: str) -> None:
+        for row, index in zip(self._counters, self._indexes(key), strict=True):
+            if row[index] < self._MAX_COUNT:
+                row[index] += 1
+        self._increments += 1
+        if self._increments >= self._sample_size:
+            self._increments //= 2
+            for row in self._counters:
+                for index, count in enumerate(row):
+                    row[index] = count // 2
+
+    def frequency(self, key: str) -> int:
+        return min(
+            row[index]
+            for row, index in zip(self._counters, self._indexes(key), strict=True)
+        )
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    size: int
+    expires_at: float
+
+
+class ResponseCache:
+    """LRU cache of response bodies bounded by their total size in bytes.
+
+    Entries expire after the TTL they were stored with. Admission follows
+    TinyLFU: once the cache is full, a new entry only gets in if it has been
+    asked for more often lately than the entries it would evict, so a scan
+    over many one-off keys can't flush the popular ones. Entries larger than
+    ``max_entry_bytes`` are never stored. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entry_bytes: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = (
+            max_bytes // 16 if max_entry_bytes is None else max_entry_bytes
+        )
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._size = 0
+        # Sized for responses of a few KiB each.
+        width = max(1024, max_bytes // 4096)
+        self._sketch = _FrequencySketch(width, sample_size=10 * width)
+
+    @property
+    def size(self) -> int:
+        """Bytes taken up by the cached entries."""
+        return self._size
+
+    def get(self, key: str) -> bytes | None:
+        """Body cached for ``key``, or None if missing or expired."""
+        if self._max_bytes <= 0:
+            return None
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= self._clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.body
+
+    def contains(self, key: str) -> bool:
+        """Whether ``key`` is cached, without counting it as a request for it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.expires_at > self._clock()
+
+    def put(self, key: str, body: bytes, ttl: float) -> bool:
+        """Cache ``body`` for ``ttl`` seconds; returns whether it was admitted."""
+        size = len(key) + len(body) + _ENTRY_OVERHEAD
+        if ttl <= 0 or size > self._max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            victims = self._victims(size - (self._max_bytes - self._size))
+            now = self._clock()
+            candidate_frequency = self._sketch.frequency(key)
+            # Expired entries are given up whatever their frequency.
+            if any(
+                self._entries[victim].expires_at > now
+                and self._sketch.frequency(victim) >= candidate_frequency
+                for victim in victims
+            ):
+                return False
+            for victim in victims:
+                self._remove(victim)
+            self._entries[key] = _Entry(body, size, now + ttl)
+            self._size += size
+            return True
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _victims(self, needed: int) -> list[str]:
+        """Least recently used keys to evict to free ``needed`` bytes."""
+        victims: list[str] = []
+        for key, entry in self._entries.items():
+            if needed <= 0:
+                break
+            victims.append(key)
+            needed -= entry.size
+        return victims
+
+    def _remove(self, key: str) -> None:
+        self._size -= self._entries.pop(key).size
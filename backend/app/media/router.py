@@ -1,92 +1,189 @@
+import hashlib
 import json
 import logging
-import threading
+import math
+import random
 import time
+from collections.abc import AsyncGenerator, Callable, Iterable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
 from datetime import timedelta
-from typing import Annotated, Any
+from typing import Annotated, Any, Literal, Self
 
 import httpx
-from fastapi import APIRouter, Header, HTTPException, status
-from sqlmodel import select
+from anyio import to_thread
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select
 
-from app.database import SessionDep
+from app.config import settings
+from app.database import SessionDep, engine
+from app.media.anilist_client import anilist_clients, lifespan
+from app.media.circuit_breaker import AnilistUnavailableError, CircuitBreaker
+from app.media.edges import media_content, media_json, save_neighbours
 from app.media.graphql_media_schema import Media
 from app.media.graphql_search_schema import SearchPage
-from app.media.graphql_user_schema import MediaListCollection
-from app.media.models import MediaFile, SearchFile, UserFile
-from app.media.queries import MEDIA_QUERY, SEARCH_QUERY, USER_QUERY
+from app.media.graphql_user_schema import (
+    MediaList,
+    MediaListCollection,
+    MediaListGroup,
+    MediaListStatus,
+    MediaType,
+)
+from app.media.invalidation import (
+    InvalidationListener,
+    connect_listener,
+    publish,
+)
+from app.media.models import (
+    BaseMetadataMixin,
+    MediaFile,
+    NegativeCacheEntry,
+    SearchFile,
+    UserFile,
+)
+from app.media.payloads import load_user_list, store_user_list
+from app.media.queries import (
+    MEDIA_PROBE_BATCH_SIZE,
+    MEDIA_QUERY,
+    MEDIA_UPDATES_QUERY,
+    RECOMMENDATIONS_PER_PAGE,
+    SEARCH_QUERY,
+    USER_LIST_CHUNK_SIZE,
+    USER_LIST_TYPES,
+    USER_LIST_UPDATES_PER_PAGE,
+    USER_LIST_UPDATES_QUERY,
+    build_media_batch_query,
+    build_recommendation_pages_query,
+    build_user_lists_query,
+    media_batch_size,
+    recommendation_pages_per_query,
+)
+from app.media.rate_limit import create_rate_limiter
+from app.media.refresh import PeriodicRefresher
+from app.media.response_cache import ResponseCache
+from app.media.scheduler import (
+    ClientUsage,
+    PriorityScheduler,
+    Requester,
+    RequestPriority,
+)
+from app.media.single_flight import (
+    SingleFlight,
+    lock_keys,
+    try_lock_keys,
+    wait_for_key,
+)
+from app.media.ttl import (
+    FixedTtlPolicy,
+    MediaTtlPolicy,
+    TtlPolicy,
+    UserListTtlPolicy,
+)
 from app.utils import tz_datetime
 
-router = APIRouter(tags=["media"])
+# Background threads are daemons: one still stuck on AniList or the rate
+# limiter after this many seconds is left behind rather than hold up shutdown.
+_SHUTDOWN_TIMEOUT = 10.0
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncGenerator[None]:
+    """Run the AniList clients and background threads with the app."""
+    async with lifespan(app):
+        _background_refresher.start()
+        if settings.ANILIST_CACHE_INVALIDATION:
+            _invalidation_listener.start()
+        try:
+            yield
+        finally:
+            await to_thread.run_sync(_invalidation_listener.stop, _SHUTDOWN_TIMEOUT)
+            await to_thread.run_sync(_background_refresher.stop, _SHUTDOWN_TIMEOUT)
+
+
+router = APIRouter(tags=["media"], lifespan=_lifespan)
 
 
 logger = logging.getLogger(__name__)
 
 AnilistToken = Annotated[str | None, Header(alias="X-Anilist-Token")]
+# Lets clients mark bulk work (e.g. hydrating a whole list) as background so
+# lookups a user is waiting on are served first.
+PriorityHint = Annotated[
+    Literal["interactive", "normal", "background"] | None,
+    Header(alias="X-Request-Priority"),
+]
 
 
-ANILIST_URL = "https://graphql.anilist.co"
+def client_key(request: Request, anilist_token: AnilistToken = None) -> str:
+    """Identify who a request is for when sharing the AniList budget fairly.
 
-_DEFAULT_RATE_LIMIT_PER_MINUTE = 30
-_MAX_RATE_LIMIT_RETRIES = 3
-_RATE_LIMIT_FALLBACK_COOLDOWN = 60.0
+    Logged-in users are keyed by a hash of their AniList token so they keep
+    their share across networks; everyone else by client address.
+    """
+    if anilist_token:
+        token_hash = hashlib.sha256(anilist_token.encode()).hexdigest()[:16]
+        return f"token:{token_hash}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
 
-class _RateLimiter:
-    """Spaces and backs off AniList requests to respect the API rate limit.
+ClientKey = Annotated[str, Depends(client_key)]
 
-    A single shared instance is used by every request so concurrent callers are
-    throttled together rather than each tracking their own budget.
-    """
 
-    def __init__(self, requests_per_minute: int) -> None:
-        self._lock = threading.Lock()
-        # Minimum seconds between consecutive requests.
-        self._min_interval = 60.0 / requests_per_minute
-        # Earliest monotonic-clock time at which the next request may be sent.
-        self._next_request_at = 0.0
-
-    def reserve_slot(self) -> None:
-        """Block until the caller is allowed to issue the next request.
-
-        Spaces requests by the observed rate limit so concurrent callers (e.g. a
-        relations traversal fetching many media at once) don't burst past the
-        cap.
-        """
-        with self._lock:
-            start_at = max(time.monotonic(), self._next_request_at)
-            self._next_request_at = start_at + self._min_interval
-
-        delay = start_at - time.monotonic()
-        if delay > 0:
-            time.sleep(delay)
-
-    def apply_cooldown(self, seconds: float) -> None:
-        """Delay all subsequent requests by ``seconds`` (a hard backoff)."""
-        if seconds <= 0:
-            return
-        with self._lock:
-            self._next_request_at = max(
-                self._next_request_at,
-                time.monotonic() + seconds,
-            )
+def requester_for(default: RequestPriority) -> Callable[..., Requester]:
+    """Dependency building the Requester for an endpoint's default priority."""
+
+    def requester(client: ClientKey, priority_hint: PriorityHint = None) -> Requester:
+        priority = RequestPriority[priority_hint.upper()] if priority_hint else default
+        return Requester(client, priority)
+
+    return requester
 
-    def learn_limit(self, headers: httpx.Headers) -> None:
-        """Tighten request spacing from the X-RateLimit-Limit header."""
-        raw_limit = headers.get("X-RateLimit-Limit")
-        if raw_limit is None:
-            return
-        try:
-            limit = int(raw_limit)
-        except ValueError:
-            return
-        if limit <= 0:
-            return
-        with self._lock:
-            self._min_interval = 60.0 / limit
 
+InteractiveRequester = Annotated[
+    Requester,
+    Depends(requester_for(RequestPriority.INTERACTIVE)),
+]
+NormalRequester = Annotated[Requester, Depends(requester_for(RequestPriority.NORMAL))]
+BackgroundRequester = Annotated[
+    Requester,
+    Depends(requester_for(RequestPriority.BACKGROUND)),
+]
 
-_rate_limiter = _RateLimiter(_DEFAULT_RATE_LIMIT_PER_MINUTE)
+
+ANILIST_URL = "https://graphql.anilist.co"
+
+_DEFAULT_RATE_LIMIT_PER_MINUTE = 30
+_MAX_RATE_LIMIT_RETRIES = 3
+_RATE_LIMIT_FALLBACK_COOLDOWN = 60.0
+_RETRY_BACKOFF_BASE = 0.5
+_MAX_RETRY_BACKOFF = 8.0
+
+
+_rate_limiter = create_rate_limiter(_DEFAULT_RATE_LIMIT_PER_MINUTE)
+# Requests made by the server itself rather than on behalf of a client.
+_SERVER = Requester()
+_scheduler = PriorityScheduler(
+    _rate_limiter,
+    aging_seconds=settings.ANILIST_PRIORITY_AGING_SECONDS,
+    max_in_flight=settings.ANILIST_MAX_IN_FLIGHT_PER_CLIENT,
+    weights=settings.ANILIST_CLIENT_WEIGHTS,
+)
+_circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.ANILIST_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.ANILIST_CIRCUIT_RESET_SECONDS,
+)
 
 
 def _retry_after_seconds(headers: httpx.Headers) -> float:
@@ -108,228 +205,1602 @@ def _retry_after_seconds(headers: httpx.Headers) -> float:
     return _RATE_LIMIT_FALLBACK_COOLDOWN
 
 
+def _request_headers(access_token: str | None) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    if access_token:
+        headers["Authorization"] = f"Bearer {access_token}"
+    return headers
+
+
+def _partial_output(response: httpx.Response) -> dict[str, Any] | None:
+    """The payload of a response where only some aliased fields failed."""
+    try:
+        output = response.json()
+    except ValueError:
+        return None
+    if isinstance(output, dict) and output.get("data"):
+        return output
+    return None
+
+
+def _upstream_failure(response: httpx.Response, attempt: int) -> float | None:
+    """Seconds AniList asked us to back off for, or None if it answered.
+
+    Rate limiting and server errors count as AniList being unhealthy; other
+    errors are about the request itself and are left to _parse_response.
+    """
+    _rate_limiter.learn_limit(response.headers)
+
+    if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+        cooldown = _retry_after_seconds(response.headers)
+        _rate_limiter.apply_cooldown(cooldown)
+        logger.warning(
+            "AniList rate limit hit (attempt %d/%d); waiting %.1fs before retry",
+            attempt + 1,
+            _MAX_RATE_LIMIT_RETRIES + 1,
+            cooldown,
+        )
+        return cooldown
+
+    if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+        logger.warning(
+            "AniList returned %d (attempt %d/%d)",
+            response.status_code,
+            attempt + 1,
+            _MAX_RATE_LIMIT_RETRIES + 1,
+        )
+        return 0.0
+
+    return None
+
+
+class AnilistNotFoundError(ValueError):
+    """AniList has nothing under the id or name asked for, or won't show it."""
+
+
+class AnilistQueryTooComplexError(ValueError):
+    """AniList refused a query for exceeding its query complexity limit."""
+
+
+def _graphql_errors(response: httpx.Response) -> list[Any]:
+    try:
+        errors = response.json().get("errors")
+    except ValueError, AttributeError:
+        return []
+    return errors if isinstance(errors, list) else []
+
+
+def _is_too_complex(errors: list[Any]) -> bool:
+    return any(
+        "complexity" in str(error.get("message", "")).lower()
+        for error in errors
+        if isinstance(error, dict)
+    )
+
+
+def _not_found(response: httpx.Response) -> AnilistNotFoundError | None:
+    """The error for a response where every GraphQL error is a 404."""
+    errors = _graphql_errors(response)
+    if not errors or any(
+        not isinstance(error, dict) or error.get("status") != status.HTTP_404_NOT_FOUND
+        for error in errors
+    ):
+        return None
+    return AnilistNotFoundError(f"Not found on AniList: {errors}")
+
+
+def _parse_response(
+    response: httpx.Response,
+    *,
+    allow_partial_errors: bool = False,
+) -> dict[str, Any]:
+    """Return the GraphQL payload of a response AniList answered."""
+    if response.status_code != status.HTTP_200_OK:
+        partial_output = _partial_output(response) if allow_partial_errors else None
+        if partial_output is None:
+            not_found = _not_found(response)
+            if not_found is not None:
+                raise not_found
+            errors = _graphql_errors(response)
+            msg = f"Unexpected response status code: {response.status_code}"
+            if errors:
+                msg = f"{msg}; GraphQL errors: {errors}"
+            if _is_too_complex(errors):
+                raise AnilistQueryTooComplexError(msg)
+            raise ValueError(msg)
+        return partial_output
+
+    _rate_limiter.learn_remaining(response.headers)
+
+    output: dict[str, Any] = response.json()
+    if output.get("errors") and not (allow_partial_errors and output.get("data")):
+        msg = f"GraphQL errors occurred: {output['errors']}"
+        if _is_too_complex(output["errors"]):
+            raise AnilistQueryTooComplexError(msg)
+        raise ValueError(msg)
+    return output
+
+
+def _check_circuit() -> None:
+    if not _circuit_breaker.allow_request():
+        msg = "AniList is unavailable; not sending requests for now"
+        raise AnilistUnavailableError(msg, _circuit_breaker.retry_after())
+
+
+def _record_attempt(
+    response: httpx.Response | None,
+    attempt: int,
+) -> float | None:
+    """Update the circuit from an attempt; the backoff owed if it failed."""
+    cooldown = 0.0 if response is None else _upstream_failure(response, attempt)
+    if cooldown is None:
+        _circuit_breaker.record_success()
+    else:
+        _circuit_breaker.record_failure()
+    return cooldown
+
+
+def _retry_delay(attempt: int, deadline: float, cooldown: float) -> float:
+    """Jittered backoff before the next attempt, within the request deadline.
+
+    ``cooldown`` is time the rate limiter will make the next attempt wait
+    anyway. Raises AnilistUnavailableError when retrying can't finish in time.
+    """
+    if attempt == _MAX_RATE_LIMIT_RETRIES:
+        raise _retries_exhausted(cooldown)
+
+    # Full jitter, so callers that failed together don't retry together.
+    backoff = min(_MAX_RETRY_BACKOFF, _RETRY_BACKOFF_BASE * 2**attempt)
+    delay = random.uniform(0, backoff)  # noqa: S311
+    if time.monotonic() + cooldown + delay > deadline:
+        msg = "AniList did not recover before the request deadline"
+        raise AnilistUnavailableError(msg, cooldown + delay)
+    return delay
+
+
+def _retries_exhausted(cooldown: float) -> AnilistUnavailableError:
+    msg = f"AniList unavailable after {_MAX_RATE_LIMIT_RETRIES + 1} attempts"
+    return AnilistUnavailableError(msg, max(cooldown, _circuit_breaker.retry_after()))
+
+
 def graphql_request(
     query: str,
-    variables: dict[str, int | str],
+    variables: dict[str, Any],
     access_token: str | None = None,
+    *,
+    allow_partial_errors: bool = False,
+    requester: Requester = _SERVER,
 ) -> dict[str, Any]:
-    headers: dict[str, str] = {}
-    if access_token:
-        headers["Authorization"] = f"Bearer {access_token}"
+    """Send a query to AniList through the shared client and rate limiter.
 
+    With ``allow_partial_errors`` a response carrying errors is still returned
+    as long as some data came back, e.g. an aliased batch where one id is gone.
+    ``requester`` decides how soon the request gets a rate limit slot.
+    Raises AnilistUnavailableError when AniList is down or keeps rate limiting
+    us past ANILIST_REQUEST_DEADLINE.
+    """
+    headers = _request_headers(access_token)
     payload = {"query": query, "variables": variables}
+    client = anilist_clients.sync_client()
+    deadline = time.monotonic() + settings.ANILIST_REQUEST_DEADLINE
 
     for attempt in range(_MAX_RATE_LIMIT_RETRIES + 1):
-        _rate_limiter.reserve_slot()
-
-        response = httpx.post(ANILIST_URL, headers=headers, json=payload, timeout=60)
-        _rate_limiter.learn_limit(response.headers)
-
-        if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
-            cooldown = _retry_after_seconds(response.headers)
-            _rate_limiter.apply_cooldown(cooldown)
-            logger.warning(
-                "AniList rate limit hit (attempt %d/%d); waiting %.1fs before retry",
-                attempt + 1,
-                _MAX_RATE_LIMIT_RETRIES + 1,
-                cooldown,
+        _check_circuit()
+        response: httpx.Response | None = None
+        try:
+            with _scheduler.slot(requester):
+                response = client.post(ANILIST_URL, headers=headers, json=payload)
+        except httpx.TransportError:
+            logger.warning("AniList request failed", exc_info=True)
+        cooldown = _record_attempt(response, attempt)
+        if response is not None and cooldown is None:
+            return _parse_response(
+                response,
+                allow_partial_errors=allow_partial_errors,
             )
+        time.sleep(_retry_delay(attempt, deadline, cooldown or 0.0))
+
+    raise _retries_exhausted(0.0)
+
+
+MAX_CACHE_AGE = timedelta(days=30)
+MAX_MEDIA_IDS_PER_REQUEST = 100
+
+
+# Entries are served straight away and refreshed in the background for this
+# long after they expire; later, the request waits for the refresh. Measured
+# from each entry's own expiry, so it holds for long-lived entries too.
+STALE_GRACE = timedelta(days=60)
+
+
+# How long rows of each table stay fresh; see app.media.ttl.
+MEDIA_TTL: TtlPolicy[MediaFile] = MediaTtlPolicy()
+USER_TTL: TtlPolicy[UserFile] = UserListTtlPolicy()
+SEARCH_TTL: TtlPolicy[SearchFile] = FixedTtlPolicy(MAX_CACHE_AGE)
+
+
+def _is_outdated(
+    cache_file: BaseMetadataMixin | None,
+    refresh_ahead: timedelta = timedelta(0),
+) -> bool:
+    """Whether ``cache_file`` is missing or expires within ``refresh_ahead``."""
+    if cache_file is None or cache_file.data_timestamp is None:
+        return True
+    return tz_datetime.now() + refresh_ahead > _expires_at(cache_file)
+
+
+def _expires_at(cache_file: BaseMetadataMixin) -> tz_datetime.datetime:
+    """Rows without an expiry expire MAX_CACHE_AGE after they were downloaded."""
+    if cache_file.data_timestamp is None:
+        return tz_datetime.now()
+    return cache_file.update_at or cache_file.data_timestamp + MAX_CACHE_AGE
+
+
+def _mark_fresh[T: BaseMetadataMixin](cache_file: T, policy: TtlPolicy[T]) -> None:
+    """Stamp ``cache_file`` as downloaded now and work out when it expires."""
+    cache_file.data_timestamp = tz_datetime.now()
+    cache_file.update_at = policy.expires_at(cache_file)
+
+
+def _can_serve_stale(cache_file: BaseMetadataMixin) -> bool:
+    return (
+        cache_file.data_timestamp is not None
+        and tz_datetime.now() - _expires_at(cache_file) <= STALE_GRACE
+    )
+
+
+def _serve_stale(response: Response, data_timestamp: tz_datetime.datetime) -> None:
+    """Flag ``response`` as an outdated copy served while AniList is down."""
+    age = tz_datetime.now() - data_timestamp
+    response.headers["Age"] = str(max(0, int(age.total_seconds())))
+    response.headers["X-Cache-Status"] = "stale"
+
+
+def _unavailable(e: AnilistUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+def _json_response(content: str | bytes) -> Response:
+    """Send cached JSON as stored, skipping response model validation."""
+    return Response(content=content, media_type="application/json")
+
+
+# Responses of fresh cache rows, kept by each worker until the row expires so
+# repeated hits skip the database. Sessions only connect on their first query,
+# so a hit never takes a connection from the pool.
+_response_cache = ResponseCache(settings.ANILIST_RESPONSE_CACHE_BYTES)
+
+
+def _invalidate(session: Session, key: str) -> None:
+    """Drop the response cached for ``key`` here, and elsewhere on commit."""
+    _response_cache.discard(key)
+    if settings.ANILIST_CACHE_INVALIDATION:
+        publish(session, key)
+
+
+_invalidation_listener = InvalidationListener(
+    lambda: connect_listener(engine),
+    _response_cache.discard,
+    _response_cache.clear,
+)
+
+
+def _remember_response(
+    key: str,
+    cache_file: BaseMetadataMixin,
+    content: str | bytes,
+) -> None:
+    ttl = (_expires_at(cache_file) - tz_datetime.now()).total_seconds()
+    body = content.encode() if isinstance(content, str) else content
+    _response_cache.put(key, body, ttl)
+
+
+# What AniList doesn't have or won't show is remembered this long, so repeated
+# requests for it are answered without AniList or the rate limiter.
+MEDIA_NOT_FOUND_TTL = timedelta(hours=6)
+USER_NOT_FOUND_TTL = timedelta(hours=1)
+PRIVATE_LIST_TTL = timedelta(minutes=15)
+
+
+def _negative_cached(
+    session: Session,
+    keys: Iterable[str],
+) -> dict[str, NegativeCacheEntry]:
+    statement = select(NegativeCacheEntry).where(
+        col(NegativeCacheEntry.key).in_(list(keys)),
+        col(NegativeCacheEntry.expires_at) > tz_datetime.now(),
+    )
+    return {entry.key: entry for entry in session.exec(statement)}
+
+
+def _check_negative_cache(session: Session, keys: Iterable[str]) -> None:
+    """Raise the error remembered for any of ``keys``."""
+    entry = next(iter(_negative_cached(session, keys).values()), None)
+    if entry is not None:
+        raise HTTPException(
+            status_code=entry.status_code,
+            detail=entry.detail,
+            headers={"X-Cache-Status": "negative"},
+        )
+
+
+def _remember_missing(
+    session: Session,
+    key: str,
+    status_code: int,
+    detail: str,
+    ttl: timedelta,
+) -> HTTPException:
+    """Negatively cache ``key`` without committing; returns the error to raise."""
+    expires_at = tz_datetime.now() + ttl
+    statement = (
+        insert(NegativeCacheEntry)
+        .values(key=key, status_code=status_code, detail=detail, expires_at=expires_at)
+        .on_conflict_do_update(
+            index_elements=[col(NegativeCacheEntry.key)],
+            set_={
+                "status_code": status_code,
+                "detail": detail,
+                "expires_at": expires_at,
+            },
+        )
+    )
+    session.exec(statement)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+_single_flight: SingleFlight[str | bytes] = SingleFlight()
+
+
+def _coalesced(
+    session: Session,
+    key: str,
+    download: Callable[[], str | bytes],
+) -> str | bytes:
+    """Run ``download`` once for every concurrent cache miss on ``key``.
+
+    Threads in this worker wait for the leader's result. Other workers poll a
+    Postgres advisory lock held until the leader commits, without keeping a
+    connection meanwhile, and ``download`` re-reads the row after the lock so
+    they find the leader's copy.
+    """
+
+    def locked_download() -> str | bytes:
+        wait_for_key(session, key)
+        try:
+            content = download()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return content
+
+    return _single_flight.do(key, locked_download)
+
+
+def _in_background(requester: Requester) -> Requester:
+    return replace(requester, priority=RequestPriority.BACKGROUND)
+
+
+def _refresh_in_background(
+    key: str,
+    download: Callable[[Session], str | bytes],
+) -> None:
+    """Refresh a cache entry after the response has been sent.
+
+    Used as a background task, so it gets its own session and only logs
+    failures; ``download`` should run at background priority.
+    """
+    try:
+        with Session(engine) as session:
+            _coalesced(session, key, lambda: download(session))
+    except Exception:
+        logger.exception("Background refresh of %r failed", key)
+
+
+def _save_media(
+    session: Session,
+    media_id: int,
+    content: dict[str, Any],
+    media_file: MediaFile | None,
+) -> MediaFile:
+    """Insert or refresh the cached copy of a media without committing.
+
+    The payload is validated here, once, and stored as JSON, so cache hits
+    never parse it again. Recommended and related media go to the edge tables.
+    """
+    canonical = Media.model_validate(content).model_dump(
+        mode="json",
+        by_alias=True,
+        exclude_unset=True,
+    )
+    save_neighbours(session, media_id, canonical)
+    _invalidate(session, f"media:{media_id}")
+    canonical_content = json.dumps(canonical)
+    if media_file:
+        media_file.content = canonical_content
+        media_file.anilist_updated_at = content.get("updatedAt")
+        reason = "refresh"
+    else:
+        media_file = MediaFile(
+            id=media_id,
+            content=canonical_content,
+            anilist_updated_at=content.get("updatedAt"),
+        )
+        session.add(media_file)
+        reason = "new"
+    _mark_fresh(media_file, MEDIA_TTL)
+    media_file.full_sync_at = media_file.data_timestamp
+    logger.info("Downloaded media %s from AniList (%s)", media_id, reason)
+    return media_file
+
+
+# Votes on recommendations don't change a media's updatedAt, so probed media
+# are still downloaded in full this often.
+MAX_MEDIA_FULL_SYNC_AGE = timedelta(days=180)
+
+
+def _needs_full_sync(media_file: MediaFile) -> bool:
+    return (
+        media_file.anilist_updated_at is None
+        or media_file.full_sync_at is None
+        or tz_datetime.now() - media_file.full_sync_at > MAX_MEDIA_FULL_SYNC_AGE
+    )
+
+
+def _revalidate_media(
+    media_files: list[MediaFile],
+    anilist_token: str | None,
+    requester: Requester,
+) -> list[MediaFile]:
+    """Keep outdated media AniList hasn't changed; return the ones it has.
+
+    With ANILIST_MEDIA_REVALIDATION set to "probe", only the ``updatedAt`` of
+    each media is asked for, many media per request, and unchanged rows are
+    marked fresh, uncommitted, without downloading them again. Media last
+    downloaded in full over MAX_MEDIA_FULL_SYNC_AGE ago count as changed.
+    """
+    if settings.ANILIST_MEDIA_REVALIDATION != "probe":
+        return media_files
+
+    changed = [media_file for media_file in media_files if _needs_full_sync(media_file)]
+    probed = [
+        media_file for media_file in media_files if not _needs_full_sync(media_file)
+    ]
+    for start in range(0, len(probed), MEDIA_PROBE_BATCH_SIZE):
+        batch = probed[start : start + MEDIA_PROBE_BATCH_SIZE]
+        graphql_data = graphql_request(
+            MEDIA_UPDATES_QUERY,
+            {
+                "ids": [media_file.id for media_file in batch],
+                "perPage": MEDIA_PROBE_BATCH_SIZE,
+            },
+            anilist_token,
+            requester=requester,
+        )
+        updated_at = {
+            media["id"]: media["updatedAt"]
+            for media in graphql_data["data"]["Page"]["media"] or []
+            if media is not None
+        }
+        for media_file in batch:
+            if updated_at.get(media_file.id) == media_file.anilist_updated_at:
+                _mark_fresh(media_file, MEDIA_TTL)
+            else:
+                changed.append(media_file)
+
+    if probed:
+        logger.info(
+            "Revalidated %d media against AniList; %d unchanged",
+            len(probed),
+            len(media_files) - len(changed),
+        )
+    return changed
+
+
+def _download_media(
+    session: Session,
+    media_id: int,
+    anilist_token: str | None,
+    requester: Requester,
+) -> str:
+    statement = (
+        select(MediaFile)
+        .where(MediaFile.id == media_id)
+        .execution_options(populate_existing=True)
+    )
+    media_file = session.exec(statement).first()
+    if media_file is None or (
+        _is_outdated(media_file)
+        and _revalidate_media([media_file], anilist_token, requester)
+    ):
+        graphql_data = graphql_request(
+            MEDIA_QUERY,
+            {"mediaId": media_id},
+            anilist_token,
+            requester=requester,
+        )
+        content = graphql_data["data"]["Media"]
+        _page_recommendations({media_id: content}, anilist_token, requester)
+        _save_media(session, media_id, content, media_file)
+    return media_json(session, [media_id])[media_id]
+
+
+def _alias_error(alias: str, errors: list[Any]) -> ValueError:
+    """The error AniList returned instead of a result for ``alias``.
+
+    Errors are matched to the alias by their path. Errors without a path are
+    taken to be the alias's too, so it only counts as not found when every one
+    of them is a 404.
+    """
+    matching = [
+        error
+        for error in errors
+        if isinstance(error, dict) and (error.get("path") or [alias])[0] == alias
+    ]
+    msg = f"No result for {alias}: {matching}"
+    if matching and all(
+        error.get("status") == status.HTTP_404_NOT_FOUND for error in matching
+    ):
+        return AnilistNotFoundError(msg)
+    return ValueError(msg)
+
+
+def _fetch_aliased[T](
+    items: list[T],
+    build_query: Callable[[list[T]], tuple[str, dict[str, int | str]]],
+    anilist_token: str | None,
+    requester: Requester,
+) -> list[dict[str, Any] | ValueError]:
+    """Fetch ``items`` in one aliased query, splitting it if too complex.
+
+    Returns the result of each alias in the order of ``items``, or the error
+    AniList returned for it instead: AnilistNotFoundError if it has nothing
+    under that id.
+    """
+    query, variables = build_query(items)
+    try:
+        graphql_data = graphql_request(
+            query,
+            variables,
+            anilist_token,
+            allow_partial_errors=True,
+            requester=requester,
+        )
+    except AnilistQueryTooComplexError:
+        if len(items) == 1:
+            raise
+        middle = len(items) // 2
+        logger.warning("Aliased query of %d too complex; splitting", len(items))
+        return [
+            *_fetch_aliased(items[:middle], build_query, anilist_token, requester),
+            *_fetch_aliased(items[middle:], build_query, anilist_token, requester),
+        ]
+
+    errors = graphql_data.get("errors") or []
+    if errors:
+        logger.warning("Partial aliased query: %s", errors)
+    # Aliases come back in the order they were selected in.
+    return [
+        _alias_error(alias, errors) if result is None else result
+        for alias, result in graphql_data["data"].items()
+    ]
+
+
+def _fetch_media_batch(
+    media_ids: list[int],
+    anilist_token: str | None,
+    requester: Requester,
+) -> tuple[dict[int, dict[str, Any]], list[int]]:
+    """Fetch several media in one aliased query.
+
+    Returns the media downloaded, and the ids AniList has nothing under.
+    """
+    results = _fetch_aliased(
+        media_ids,
+        build_media_batch_query,
+        anilist_token,
+        requester,
+    )
+    downloaded = {
+        media["id"]: media for media in results if not isinstance(media, ValueError)
+    }
+    not_found = [
+        media_id
+        for media_id, result in zip(media_ids, results, strict=True)
+        if isinstance(result, AnilistNotFoundError)
+    ]
+    return downloaded, not_found
+
+
+def _is_rated_enough(node: dict[str, Any] | None) -> bool:
+    rating = (node or {}).get("rating") or 0
+    return rating >= settings.ANILIST_MIN_RECOMMENDATION_RATING
+
+
+def _recommendation_pages_left(content: dict[str, Any], max_pages: int) -> range:
+    """Recommendation pages after the first worth fetching for a media.
+
+    Drops the first page's paging info, which no longer applies once the
+    later pages are merged in.
+    """
+    recommendations = content.get("recommendations") or {}
+    page_info = recommendations.pop("pageInfo", None) or {}
+    nodes = recommendations.get("nodes") or []
+    if not page_info.get("hasNextPage") or (nodes and not _is_rated_enough(nodes[-1])):
+        return range(0)
+    last_page = min(page_info.get("lastPage") or max_pages, max_pages)
+    return range(2, last_page + 1)
+
+
+def _page_recommendations(
+    contents: dict[int, dict[str, Any]],
+    anilist_token: str | None,
+    requester: Requester,
+) -> None:
+    """Merge the rest of each media's recommendations into ``contents``.
+
+    Pages are fetched best rated first until ANILIST_MAX_RECOMMENDATIONS are
+    cached or ratings drop below ANILIST_MIN_RECOMMENDATION_RATING. Pages of
+    every media are packed into shared aliased queries, so a whole batch of
+    media usually needs a single extra rate limit slot.
+    """
+    max_recommendations = settings.ANILIST_MAX_RECOMMENDATIONS
+    max_pages = math.ceil(max_recommendations / RECOMMENDATIONS_PER_PAGE)
+    pending = [
+        (media_id, page)
+        for media_id, content in contents.items()
+        for page in _recommendation_pages_left(content, max_pages)
+    ]
+
+    # Media whose recommendations ran out or fell below the minimum rating.
+    exhausted: set[int] = set()
+    pages_per_query = recommendation_pages_per_query()
+    for start in range(0, len(pending), pages_per_query):
+        pages = [
+            (media_id, page)
+            for media_id, page in pending[start : start + pages_per_query]
+            if media_id not in exhausted
+        ]
+        if not pages:
             continue
+        results = _fetch_aliased(
+            pages,
+            build_recommendation_pages_query,
+            anilist_token,
+            requester,
+        )
+        for (media_id, _), result in zip(pages, results, strict=True):
+            if media_id in exhausted:
+                continue
+            page_result = {} if isinstance(result, ValueError) else result
+            nodes = (page_result.get("recommendations") or {}).get("nodes") or []
+            rated_nodes = [node for node in nodes if _is_rated_enough(node)]
+            if len(rated_nodes) < RECOMMENDATIONS_PER_PAGE:
+                exhausted.add(media_id)
+            contents[media_id]["recommendations"]["nodes"].extend(rated_nodes)
 
-        if response.status_code != status.HTTP_200_OK:
-            msg = f"Unexpected response status code: {response.status_code}"
-            raise ValueError(msg)
+    for content in contents.values():
+        recommendations = content.get("recommendations") or {}
+        if recommendations.get("nodes"):
+            del recommendations["nodes"][max_recommendations:]
 
-        # If the window is drained, hold off the next request until it resets so
-        # we don't deliberately walk into a 429.
-        raw_remaining = response.headers.get("X-RateLimit-Remaining")
-        raw_reset = response.headers.get("X-RateLimit-Reset")
-        if raw_remaining is not None and raw_reset is not None:
-            try:
-                if int(raw_remaining) <= 0:
-                    _rate_limiter.apply_cooldown(float(raw_reset) - time.time())
-            except ValueError:
-                pass
 
-        output = response.json()
-        if output.get("errors"):
-            msg = f"GraphQL errors occurred: {output['errors']}"
-            raise ValueError(msg)
-        return output
+def fetch_media(
+    session: Session,
+    media_ids: Iterable[int],
+    anilist_token: str | None = None,
+    requester: Requester = _SERVER,
+    refresh_ahead: timedelta = timedelta(0),
+) -> dict[int, MediaFile]:
+    """Return cached media, downloading missing or outdated ones in batches.
+
+    Media expiring within ``refresh_ahead`` count as outdated.
 
-    msg = f"AniList rate limit exceeded after {_MAX_RATE_LIMIT_RETRIES + 1} attempts"
-    raise ValueError(msg)
+    Media are packed into aliased queries sized against AniList's query
+    complexity limit, so many media share one rate limit slot. Each batch is
+    committed as soon as it is stored, so a failure only loses its own batch.
+    Ids AniList doesn't know about are left out of the result.
+    """
+    unique_ids = list(dict.fromkeys(media_ids))
+    statement = select(MediaFile).where(col(MediaFile.id).in_(unique_ids))
+    media_files = {media_file.id: media_file for media_file in session.exec(statement)}
 
+    stale_ids = [
+        media_id
+        for media_id in unique_ids
+        if _is_outdated(media_files.get(media_id), refresh_ahead)
+    ]
+    # Media AniList recently didn't have aren't asked for again.
+    missing = _negative_cached(session, (f"media:{media_id}" for media_id in stale_ids))
+    stale_ids = [
+        media_id for media_id in stale_ids if f"media:{media_id}" not in missing
+    ]
+    if not stale_ids:
+        return media_files
 
-MAX_CACHE_AGE = timedelta(days=30)
+    stale_ids = _lock_outdated(session, media_files, stale_ids, refresh_ahead)
+    changed = _revalidate_media(
+        [media_files[media_id] for media_id in stale_ids if media_id in media_files],
+        anilist_token,
+        requester,
+    )
+    changed_ids = {media_file.id for media_file in changed}
+    stale_ids = [
+        media_id
+        for media_id in stale_ids
+        if media_id not in media_files or media_id in changed_ids
+    ]
+    session.commit()
+
+    batch_size = media_batch_size()
+    for start in range(0, len(stale_ids), batch_size):
+        # The locks went with the last commit.
+        batch = _lock_outdated(
+            session,
+            media_files,
+            stale_ids[start : start + batch_size],
+            refresh_ahead,
+        )
+        if not batch:
+            continue
+        downloaded, not_found = _fetch_media_batch(batch, anilist_token, requester)
+        _page_recommendations(downloaded, anilist_token, requester)
+        # Ids that failed for other reasons are simply tried again next time.
+        for media_id in not_found:
+            _remember_missing(
+                session,
+                f"media:{media_id}",
+                status.HTTP_404_NOT_FOUND,
+                "Media not found on AniList.",
+                MEDIA_NOT_FOUND_TTL,
+            )
+        for media_id, content in downloaded.items():
+            media_files[media_id] = _save_media(
+                session,
+                media_id,
+                content,
+                media_files.get(media_id),
+            )
+        session.commit()
+
+    return media_files
+
+
+def _lock_outdated(
+    session: Session,
+    media_files: dict[int, MediaFile],
+    media_ids: list[int],
+    refresh_ahead: timedelta,
+) -> list[int]:
+    """Lock ``media_ids`` until the next commit; return those still outdated.
+
+    Another worker may have downloaded some while we waited, so their rows are
+    read again into ``media_files``.
+    """
+    lock_keys(session, (f"media:{media_id}" for media_id in media_ids))
+    statement = (
+        select(MediaFile)
+        .where(col(MediaFile.id).in_(media_ids))
+        .execution_options(populate_existing=True)
+    )
+    media_files.update(
+        (media_file.id, media_file) for media_file in session.exec(statement)
+    )
+    return [
+        media_id
+        for media_id in media_ids
+        if _is_outdated(media_files.get(media_id), refresh_ahead)
+    ]
+
+
+# The background scans refresh media this long before they expire. Expiry is
+# jittered per row, so media cached on the same day don't all come due at once.
+REFRESH_AHEAD = timedelta(hours=1)
+_REFRESHER = Requester("refresh", RequestPriority.BACKGROUND)
+# Media the scan fails to refresh, e.g. gone from AniList, are tried again
+# later so they don't come back first in every scan; see _refresh_retry_delay.
+REFRESH_RETRY_MIN = timedelta(hours=1)
+REFRESH_RETRY_MAX = timedelta(days=7)
 
 
-def _is_outdated(data_timestamp: tz_datetime.datetime | None) -> bool:
-    return data_timestamp is None or tz_datetime.now() - data_timestamp > MAX_CACHE_AGE
+def _refresh_retry_delay(media_file: MediaFile) -> timedelta:
+    """Wait as long again as since the last download, so each failure doubles it."""
+    if media_file.data_timestamp is None:
+        return REFRESH_RETRY_MIN
+    age = tz_datetime.now() - media_file.data_timestamp
+    return min(max(age, REFRESH_RETRY_MIN), REFRESH_RETRY_MAX)
 
 
-@router.get("/media/{media_id}")
+def _try_lock_media(session: Session, media_ids: Iterable[int]) -> list[int]:
+    """Lock the media nobody else has locked, in the order given."""
+    keys = {f"media:{media_id}": media_id for media_id in media_ids}
+    locked = set(try_lock_keys(session, keys))
+    return [media_id for key, media_id in keys.items() if key in locked]
+
+
+def refresh_expiring_media(session: Session, limit: int) -> int:
+    """Refresh up to ``limit`` media expiring soonest.
+
+    Media another worker is refreshing are skipped rather than waited for.
+    Media left outdated, e.g. gone from AniList or in a batch that failed,
+    have their expiry pushed back. Returns how many were refreshed.
+    """
+    due_ids = (
+        select(MediaFile.id)
+        .where(col(MediaFile.update_at) < tz_datetime.now() + REFRESH_AHEAD)
+        .order_by(col(MediaFile.update_at))
+        .limit(limit)
+    )
+    media_ids = _try_lock_media(session, session.exec(due_ids))
+    if not media_ids:
+        session.rollback()
+        return 0
+    try:
+        fetch_media(
+            session,
+            media_ids,
+            requester=_REFRESHER,
+            refresh_ahead=REFRESH_AHEAD,
+        )
+    except ValueError:
+        # Batches committed before the failure are kept.
+        session.rollback()
+        logger.warning("Background refresh stopped early", exc_info=True)
+
+    due_media = (
+        select(MediaFile)
+        .where(col(MediaFile.id).in_(_try_lock_media(session, media_ids)))
+        .execution_options(populate_existing=True)
+    )
+    refreshed = 0
+    for media_file in session.exec(due_media):
+        if _is_outdated(media_file, REFRESH_AHEAD):
+            retry_delay = _refresh_retry_delay(media_file)
+            media_file.update_at = tz_datetime.now() + retry_delay
+        else:
+            refreshed += 1
+    session.commit()
+    return refreshed
+
+
+def _refresh_expiring_media() -> None:
+    with Session(engine) as session:
+        refreshed = refresh_expiring_media(
+            session,
+            settings.ANILIST_BACKGROUND_REFRESH_BATCH,
+        )
+    if refreshed:
+        logger.info("Refreshed %d media before they expired", refreshed)
+
+
+_background_refresher = PeriodicRefresher(
+    "anilist-media-refresh",
+    _refresh_expiring_media,
+    settings.ANILIST_BACKGROUND_REFRESH_INTERVAL,
+)
+
+
+@router.get("/media/{media_id}", response_model=Media)
 def read_media(
     session: SessionDep,
+    background_tasks: BackgroundTasks,
     media_id: int,
+    requester: NormalRequester,
     anilist_token: AnilistToken = None,
-) -> Media:
+) -> Response:
     """
     Retrieve media.
+    An outdated copy is served straight away, flagged with an
+    ``X-Cache-Status: stale`` header, and refreshed in the background. It is
+    also served while AniList is unavailable.
     """
 
-    statement = select(MediaFile).where(MediaFile.id == media_id)
-    media_file = session.exec(statement).first()
+    cached = _response_cache.get(f"media:{media_id}")
+    if cached is not None:
+        return _json_response(cached)
 
-    if not media_file or _is_outdated(media_file.data_timestamp):
-        try:
-            graphql_data = graphql_request(
-                MEDIA_QUERY,
-                {"mediaId": media_id},
+    statement = select(MediaFile, media_content()).where(MediaFile.id == media_id)
+    row = session.exec(statement).first()
+    media_file: MediaFile | None = None
+    # Only sent when media_file is set.
+    cached_content = ""
+    if row is not None:
+        media_file, cached_content = row
+
+    if media_file and _is_outdated(media_file) and _can_serve_stale(media_file):
+        background = _in_background(requester)
+        background_tasks.add_task(
+            _refresh_in_background,
+            f"media:{media_id}",
+            lambda session: _download_media(
+                session,
+                media_id,
                 anilist_token,
+                background,
+            ),
+        )
+        response = _json_response(cached_content)
+        _serve_stale(response, media_file.data_timestamp)
+        return response
+
+    if not media_file or _is_outdated(media_file):
+        _check_negative_cache(session, [f"media:{media_id}"])
+        try:
+            content = _coalesced(
+                session,
+                f"media:{media_id}",
+                lambda: _download_media(
+                    session,
+                    media_id,
+                    anilist_token,
+                    requester,
+                ),
             )
+        except AnilistNotFoundError as e:
+            error = _remember_missing(
+                session,
+                f"media:{media_id}",
+                status.HTTP_404_NOT_FOUND,
+                "Media not found on AniList.",
+                MEDIA_NOT_FOUND_TTL,
+            )
+            session.commit()
+            raise error from e
+        except AnilistUnavailableError as e:
+            if media_file is None:
+                raise _unavailable(e) from e
+            logger.warning("Serving stale media %s: %s", media_id, e)
+            response = _json_response(cached_content)
+            _serve_stale(response, media_file.data_timestamp)
+            return response
         except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=str(e),
             ) from e
+        return _json_response(content)
 
-        if media_file:
-            media_file.content = json.dumps(graphql_data["data"]["Media"])
-            media_file.data_timestamp = tz_datetime.now()
-            reason = "refresh"
-        else:
-            media_file = MediaFile(
-                id=media_id,
-                content=json.dumps(graphql_data["data"]["Media"]),
-                data_timestamp=tz_datetime.now(),
+    _remember_response(f"media:{media_id}", media_file, cached_content)
+    return _json_response(cached_content)
+
+
+@router.get("/media", response_model=list[Media])
+def read_media_batch(
+    session: SessionDep,
+    media_ids: Annotated[list[int], Query(max_length=MAX_MEDIA_IDS_PER_REQUEST)],
+    requester: BackgroundRequester,
+    anilist_token: AnilistToken = None,
+) -> Response:
+    """
+    Retrieve several media at once.
+    Media that don't exist on AniList are omitted from the response.
+    While AniList is unavailable whatever copies are cached are served,
+    flagged as stale; the ids left out for want of one are listed in an
+    ``X-Cache-Missing`` header.
+    """
+    cached = [
+        _response_cache.get(f"media:{media_id}")
+        for media_id in dict.fromkeys(media_ids)
+    ]
+    if all(body is not None for body in cached):
+        return _json_response(b"[" + b",".join(filter(None, cached)) + b"]")
+
+    stale_since: tz_datetime.datetime | None = None
+    try:
+        media_files = fetch_media(
+            session,
+            media_ids,
+            anilist_token,
+            requester,
+        )
+    except AnilistUnavailableError as e:
+        session.rollback()
+        statement = select(MediaFile).where(col(MediaFile.id).in_(media_ids))
+        media_files = {
+            media_file.id: media_file
+            for media_file in session.exec(statement)
+            if media_file.data_timestamp is not None
+        }
+        if not media_files:
+            raise _unavailable(e) from e
+        logger.warning("Serving %d stale media: %s", len(media_files), e)
+        stale_since = min(
+            media_file.data_timestamp
+            for media_file in media_files.values()
+            if media_file.data_timestamp is not None
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        ) from e
+
+    media_contents = media_json(session, media_files)
+    if stale_since is None:
+        for media_id, content in media_contents.items():
+            _remember_response(
+                f"media:{media_id}",
+                media_files[media_id],
+                content,
             )
-            session.add(media_file)
-            reason = "new"
-        session.commit()
-        session.refresh(media_file)
-        logger.info("Downloaded media %s from AniList (%s)", media_id, reason)
+    contents = (
+        media_contents[media_id]
+        for media_id in dict.fromkeys(media_ids)
+        if media_id in media_contents
+    )
+    response = _json_response(f"[{','.join(contents)}]")
+    if stale_since is not None:
+        _serve_stale(response, stale_since)
+        missing = [
+            str(media_id)
+            for media_id in dict.fromkeys(media_ids)
+            if media_id not in media_contents
+        ]
+        if missing:
+            response.headers["X-Cache-Missing"] = ",".join(missing)
+    return response
+
+
+# List updates can't show entries removed from a list, so lists are still
+# fetched in full this often.
+MAX_USER_FULL_SYNC_AGE = timedelta(days=180)
+# An incremental refresh needing more pages of updates than this is given up
+# for a full one.
+_MAX_USER_UPDATE_PAGES = 10
+
+
+def _download_user_lists(
+    user_name: str,
+    anilist_token: str | None,
+    requester: Requester,
+) -> tuple[MediaListCollection, int | None]:
+    """Fetch a user's whole anime and manga lists and their newest updatedAt."""
+    # Both lists come in one request per chunk; only their entries are kept
+    # between chunks, merged by list.
+    groups: dict[tuple[str, MediaListStatus | None], list[MediaList | None]] = {}
+    list_updated_at: int | None = None
+    media_types = list(USER_LIST_TYPES)
+    chunk = 1
+    while media_types:
+        graphql_data = graphql_request(
+            build_user_lists_query(media_types),
+            {"userName": user_name, "chunk": chunk, "perChunk": USER_LIST_CHUNK_SIZE},
+            anilist_token,
+            requester=requester,
+        )
+        unfinished_types = []
+        for media_type in media_types:
+            raw_collection = graphql_data["data"][media_type.lower()]
+            for raw_group in raw_collection.get("lists") or []:
+                for raw_entry in (raw_group or {}).get("entries") or []:
+                    updated_at = (raw_entry or {}).get("updatedAt")
+                    if updated_at is not None:
+                        list_updated_at = max(list_updated_at or 0, updated_at)
+            collection = MediaListCollection.model_validate(raw_collection)
+            for group in collection.lists or []:
+                if group is not None:
+                    groups.setdefault((media_type, group.status), []).extend(
+                        group.entries or [],
+                    )
+            if raw_collection.get("hasNextChunk"):
+                unfinished_types.append(media_type)
+        media_types = unfinished_types
+        chunk += 1
 
-    return Media.model_validate_json(media_file.content)
+    combined_data = MediaListCollection(
+        lists=[
+            MediaListGroup(
+                entries=entries,
+                status=list_status,
+                type=MediaType(media_type),
+            )
+            for (media_type, list_status), entries in groups.items()
+        ],
+    )
+    return combined_data, list_updated_at
+
+
+def _fetch_user_list_updates(
+    user_name: str,
+    since: int,
+    anilist_token: str | None,
+    requester: Requester,
+) -> list[dict[str, Any]] | None:
+    """List entries updated at or after ``since``, newest first.
 
+    Returns None if there are too many to be worth fetching incrementally.
+    """
+    updates: list[dict[str, Any]] = []
+    for page in range(1, _MAX_USER_UPDATE_PAGES + 1):
+        graphql_data = graphql_request(
+            USER_LIST_UPDATES_QUERY,
+            {
+                "userName": user_name,
+                "page": page,
+                "perPage": USER_LIST_UPDATES_PER_PAGE,
+            },
+            anilist_token,
+            requester=requester,
+        )
+        page_data = graphql_data["data"]["Page"]
+        for entry in page_data["mediaList"] or []:
+            # Entries updated in the same second as the watermark are fetched
+            # again; merging them twice is harmless.
+            if entry["updatedAt"] < since:
+                return updates
+            updates.append(entry)
+        if not page_data["pageInfo"]["hasNextPage"]:
+            return updates
+    return None
+
+
+def _merge_list_updates(
+    collection: MediaListCollection,
+    updates: list[dict[str, Any]],
+) -> MediaListCollection:
+    """Move each updated entry into the list for its type and new status."""
+    updated_ids = {entry["mediaId"] for entry in updates}
+    groups: dict[tuple[MediaType | None, MediaListStatus], list[MediaList | None]] = {}
+    # Lists without a status (custom lists) aren't tracked by updates.
+    custom_groups: list[MediaListGroup | None] = []
+    for group in collection.lists or []:
+        if group is None or group.status is None:
+            custom_groups.append(group)
+            continue
+        groups.setdefault((group.type, group.status), []).extend(
+            entry
+            for entry in group.entries or []
+            if entry is None or entry.media_id not in updated_ids
+        )
 
-@router.get("/user/{user_name}", tags=["user"])
+    for entry in updates:
+        key = (MediaType(entry["media"]["type"]), MediaListStatus(entry["status"]))
+        groups.setdefault(key, []).append(MediaList.model_validate(entry))
+
+    return MediaListCollection(
+        lists=[
+            *(
+                MediaListGroup(entries=entries, status=list_status, type=media_type)
+                for (media_type, list_status), entries in groups.items()
+                if entries
+            ),
+            *custom_groups,
+        ],
+    )
+
+
+def _sync_user_list(
+    session: Session,
+    user_file: UserFile,
+    user_name: str,
+    anilist_token: str | None,
+    requester: Requester,
+) -> tuple[MediaListCollection, int] | None:
+    """Bring a cached list up to date from the entries updated since.
+
+    Returns None when a full download is needed instead.
+    """
+    if (
+        user_file.list_updated_at is None
+        or user_file.full_sync_at is None
+        or tz_datetime.now() - user_file.full_sync_at > MAX_USER_FULL_SYNC_AGE
+    ):
+        return None
+
+    updates = _fetch_user_list_updates(
+        user_name,
+        user_file.list_updated_at,
+        anilist_token,
+        requester,
+    )
+    if updates is None:
+        return None
+    collection = _merge_list_updates(
+        MediaListCollection.model_validate_json(load_user_list(session, user_file)),
+        updates,
+    )
+    list_updated_at = max(
+        [user_file.list_updated_at, *(entry["updatedAt"] for entry in updates)],
+    )
+    return collection, list_updated_at
+
+
+def _download_user(
+    session: Session,
+    user_name: str,
+    anilist_token: str | None,
+    requester: Requester,
+) -> str | bytes:
+    statement = (
+        select(UserFile)
+        .where(UserFile.id == user_name.lower())
+        .execution_options(populate_existing=True)
+    )
+    user_file = session.exec(statement).first()
+    if user_file and not _is_outdated(user_file):
+        return load_user_list(session, user_file)
+
+    synced = (
+        _sync_user_list(session, user_file, user_name, anilist_token, requester)
+        if user_file
+        else None
+    )
+    list_updated_at: int | None
+    if synced:
+        combined_data, list_updated_at = synced
+        full_sync_at = user_file.full_sync_at if user_file else None
+    else:
+        combined_data, list_updated_at = _download_user_lists(
+            user_name,
+            anilist_token,
+            requester,
+        )
+        full_sync_at = tz_datetime.now()
+
+    content = combined_data.model_dump_json(by_alias=True)
+    _invalidate(session, f"user:{user_name.lower()}")
+    if user_file:
+        user_file.list_updated_at = list_updated_at
+        user_file.full_sync_at = full_sync_at
+        reason = "incremental refresh" if synced else "refresh"
+    else:
+        user_file = UserFile(
+            id=user_name.lower(),
+            list_updated_at=list_updated_at,
+            full_sync_at=full_sync_at,
+        )
+        session.add(user_file)
+        reason = "new"
+    store_user_list(session, user_file, content)
+    _mark_fresh(user_file, USER_TTL)
+    logger.info("Downloaded user list %r from AniList (%s)", user_name, reason)
+    return content
+
+
+@router.get("/user/{user_name}", tags=["user"], response_model=MediaListCollection)
 def read_user(
     session: SessionDep,
+    background_tasks: BackgroundTasks,
     user_name: str,
+    requester: NormalRequester,
     anilist_token: AnilistToken = None,
-) -> MediaListCollection:
+) -> Response:
     """
     Retrieve user's media list.
+    An outdated copy is served straight away and refreshed in the background.
+    It is also served while AniList is unavailable.
     """
 
+    cached = _response_cache.get(f"user:{user_name.lower()}")
+    if cached is not None:
+        return _json_response(cached)
+
     statement = select(UserFile).where(UserFile.id == user_name.lower())
     user_file = session.exec(statement).first()
+    # An authenticated request may see a list an anonymous one can't, so it
+    # never waits on an anonymous download.
+    key = f"user:{user_name.lower()}:{'token' if anilist_token else 'anonymous'}"
 
-    if not user_file or _is_outdated(user_file.data_timestamp):
-        try:
-            raw_anime = graphql_request(
-                USER_QUERY,
-                {"userName": user_name, "type": "ANIME"},
-                anilist_token,
-            )
-            raw_manga = graphql_request(
-                USER_QUERY,
-                {"userName": user_name, "type": "MANGA"},
+    if user_file and _is_outdated(user_file) and _can_serve_stale(user_file):
+        background = _in_background(requester)
+        background_tasks.add_task(
+            _refresh_in_background,
+            key,
+            lambda session: _download_user(
+                session,
+                user_name,
                 anilist_token,
+                background,
+            ),
+        )
+        response = _json_response(load_user_list(session, user_file))
+        _serve_stale(response, user_file.data_timestamp)
+        return response
+
+    if not user_file or _is_outdated(user_file):
+        # Only anonymous requests share the answer that a list is private.
+        private_key = None if anilist_token else f"user:{user_name.lower()}:private"
+        missing_key = f"user:{user_name.lower()}:missing"
+        _check_negative_cache(session, filter(None, [missing_key, private_key]))
+        try:
+            content = _coalesced(
+                session,
+                key,
+                lambda: _download_user(
+                    session,
+                    user_name,
+                    anilist_token,
+                    requester,
+                ),
             )
+        except AnilistUnavailableError as e:
+            if user_file is None:
+                raise _unavailable(e) from e
+            logger.warning("Serving stale user list %r: %s", user_name, e)
+            response = _json_response(load_user_list(session, user_file))
+            _serve_stale(response, user_file.data_timestamp)
+            return response
         except ValueError as e:
             if "Private" in str(e):
-                raise HTTPException(
+                error = HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="User list is private. Login with AniList to access it.",
-                ) from e
+                )
+                if private_key:
+                    error = _remember_missing(
+                        session,
+                        private_key,
+                        error.status_code,
+                        error.detail,
+                        PRIVATE_LIST_TTL,
+                    )
+                    session.commit()
+                raise error from e
+            if isinstance(e, AnilistNotFoundError):
+                error = _remember_missing(
+                    session,
+                    missing_key,
+                    status.HTTP_404_NOT_FOUND,
+                    "User not found on AniList.",
+                    USER_NOT_FOUND_TTL,
+                )
+                session.commit()
+                raise error from e
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=str(e),
             ) from e
+        return _json_response(content)
 
-        anime_data = MediaListCollection.model_validate(
-            raw_anime["data"]["MediaListCollection"],
-        )
-        manga_data = MediaListCollection.model_validate(
-            raw_manga["data"]["MediaListCollection"],
-        )
+    content = load_user_list(session, user_file)
+    _remember_response(f"user:{user_name.lower()}", user_file, content)
+    return _json_response(content)
 
-        combined_data = MediaListCollection(
-            lists=[
-                *(anime_data.lists or []),
-                *(manga_data.lists or []),
-            ],
-        )
 
-        if user_file:
-            user_file.content = combined_data.model_dump_json(by_alias=True)
-            user_file.data_timestamp = tz_datetime.now()
-            reason = "refresh"
-        else:
-            user_file = UserFile(
-                id=user_name.lower(),
-                content=combined_data.model_dump_json(by_alias=True),
-                data_timestamp=tz_datetime.now(),
-            )
-            session.add(user_file)
-            reason = "new"
-        session.commit()
-        session.refresh(user_file)
-        logger.info("Downloaded user list %r from AniList (%s)", user_name, reason)
+MAX_SEARCH_PER_PAGE = 50
+
+
+@dataclass(frozen=True)
+class _Search:
+    """One page of results for a search, cached on its own."""
+
+    query: str
+    media_type: str
+    page: int
+    per_page: int
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.query}:{self.media_type}:{self.page}:{self.per_page}"
+
+    def next_page(self) -> Self:
+        return replace(self, page=self.page + 1)
+
+
+def _cached_search(session: Session, search: _Search) -> SearchFile | None:
+    statement = (
+        select(SearchFile)
+        .where(SearchFile.search_query == search.cache_key)
+        .execution_options(populate_existing=True)
+    )
+    return session.exec(statement).first()
+
+
+def _request_search(
+    search: _Search,
+    anilist_token: str | None,
+    requester: Requester,
+) -> str:
+    variables: dict[str, Any] = {
+        "search": search.query,
+        "page": search.page,
+        "perPage": search.per_page,
+        "type": search.media_type,
+    }
+    graphql_data = graphql_request(
+        SEARCH_QUERY,
+        variables,
+        anilist_token,
+        requester=requester,
+    )
+    return json.dumps(graphql_data["data"]["Page"])
+
+
+def _download_search(
+    session: Session,
+    search: _Search,
+    anilist_token: str | None,
+    requester: Requester,
+) -> str:
+    search_file = _cached_search(session, search)
+    if search_file and not _is_outdated(search_file):
+        return search_file.content
+    content = _request_search(search, anilist_token, requester)
+    return _save_search(session, search, search_file, content).content
+
+
+def _save_search(
+    session: Session,
+    search: _Search,
+    search_file: SearchFile | None,
+    content: str,
+) -> SearchFile:
+    """Store downloaded search results without committing."""
+    _invalidate(session, f"search:{search.cache_key}")
+    if search_file:
+        search_file.content = content
+        reason = "refresh"
+    else:
+        search_file = SearchFile(search_query=search.cache_key, content=content)
+        session.add(search_file)
+        reason = "new"
+    _mark_fresh(search_file, SEARCH_TTL)
+    logger.info(
+        "Downloaded search results for %r [%s] page %d from AniList (%s)",
+        search.query,
+        search.media_type,
+        search.page,
+        reason,
+    )
+    return search_file
+
+
+def _is_search_cached(session: Session, search: _Search) -> bool:
+    """Whether up to date results for ``search`` are cached already.
+
+    Results found in the database are kept in the response cache, so each
+    worker asks the database at most once while they stay fresh. This is also
+    how prefetched results get there: remembering them straight after saving
+    would be undone by the worker's own invalidation notice.
+    """
+    key = f"search:{search.cache_key}"
+    if _response_cache.contains(key):
+        return True
+    search_file = _cached_search(session, search)
+    if search_file is None or _is_outdated(search_file):
+        return False
+    _remember_response(key, search_file, search_file.content)
+    return True
+
+
+# Kept apart from _single_flight so users never wait on a prefetch.
+_prefetches: SingleFlight[None] = SingleFlight()
 
-    return MediaListCollection.model_validate_json(user_file.content)
 
+def _prefetch_search(
+    search: _Search,
+    anilist_token: str | None,
+    requester: Requester,
+) -> None:
+    """Download search results before anyone asks for them.
 
-@router.get("/search/{search_query}", tags=["search"])
-def search_media(
+    Used as a background task. Unlike :func:`_refresh_in_background` it
+    doesn't lock the key while waiting for AniList, so a user asking for the
+    page meanwhile downloads it at their own priority instead of queueing
+    behind the prefetch. The prefetched copy is dropped if theirs is being or
+    has been stored.
+    """
+    key = f"search:{search.cache_key}"
+
+    def prefetch() -> None:
+        content = _request_search(search, anilist_token, requester)
+        with Session(engine) as session:
+            if not try_lock_keys(session, [key]):
+                return
+            search_file = _cached_search(session, search)
+            if search_file and not _is_outdated(search_file):
+                return
+            _save_search(session, search, search_file, content)
+            session.commit()
+
+    try:
+        _prefetches.do(key, prefetch)
+    except Exception:
+        logger.exception("Prefetch of %r failed", key)
+
+
+def _has_next_page(content: str | bytes) -> bool:
+    page_info = json.loads(content).get("pageInfo") or {}
+    return bool(page_info.get("hasNextPage"))
+
+
+@router.get("/search/{search_query}", tags=["search"], response_model=SearchPage)
+def search_media(  # noqa: PLR0913, PLR0917
     session: SessionDep,
+    background_tasks: BackgroundTasks,
     search_query: str,
     media_type: str,
+    requester: InteractiveRequester,
+    page: Annotated[int, Query(ge=1)] = 1,
+    per_page: Annotated[int, Query(ge=1, le=MAX_SEARCH_PER_PAGE)] = 20,
     anilist_token: AnilistToken = None,
-) -> SearchPage:
+) -> Response:
     """
     Search for media by title.
     media_type can be 'ANIME' or 'MANGA'.
+    Each page is cached separately, and the next page is fetched in the
+    background so it is ready when asked for.
+    Outdated results are served straight away and refreshed in the
+    background. They are also served while AniList is unavailable.
     """
     if media_type not in ("ANIME", "MANGA"):
         msg = "media_type must be 'ANIME' or 'MANGA'."
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=msg)
 
-    cache_key = f"{search_query}:{media_type or 'ALL'}"
-    statement = select(SearchFile).where(SearchFile.search_query == cache_key)
-    search_file = session.exec(statement).first()
-
-    if not search_file or _is_outdated(search_file.data_timestamp):
-        variables: dict[str, Any] = {
-            "search": search_query,
-            "page": 1,
-            "perPage": 20,
-            "type": media_type,
-        }
-
-        graphql_data = graphql_request(SEARCH_QUERY, variables, anilist_token)
+    search = _Search(search_query, media_type, page, per_page)
+    background = _in_background(requester)
+    stale_since: tz_datetime.datetime | None = None
+    content: str | bytes | None = _response_cache.get(f"search:{search.cache_key}")
+    if content is None:
+        statement = select(SearchFile).where(
+            SearchFile.search_query == search.cache_key,
+        )
+        search_file = session.exec(statement).first()
 
-        if search_file:
-            search_file.content = json.dumps(graphql_data["data"]["Page"])
-            search_file.data_timestamp = tz_datetime.now()
-            reason = "refresh"
-        else:
-            search_file = SearchFile(
-                search_query=cache_key,
-                content=json.dumps(graphql_data["data"]["Page"]),
-                data_timestamp=tz_datetime.now(),
+        if search_file and _is_outdated(search_file) and _can_serve_stale(search_file):
+            background_tasks.add_task(
+                _refresh_in_background,
+                f"search:{search.cache_key}",
+                lambda session: _download_search(
+                    session,
+                    search,
+                    anilist_token,
+                    background,
+                ),
             )
-            session.add(search_file)
-            reason = "new"
-        session.commit()
-        session.refresh(search_file)
-        logger.info(
-            "Downloaded search results for %r [%s] from AniList (%s)",
-            search_query,
-            media_type,
-            reason,
+            stale_since = search_file.data_timestamp
+            content = search_file.content
+        elif not search_file or _is_outdated(search_file):
+            try:
+                content = _coalesced(
+                    session,
+                    f"search:{search.cache_key}",
+                    lambda: _download_search(
+                        session,
+                        search,
+                        anilist_token,
+                        requester,
+                    ),
+                )
+            except AnilistUnavailableError as e:
+                if search_file is None:
+                    raise _unavailable(e) from e
+                logger.warning("Serving stale search %r: %s", search.cache_key, e)
+                response = _json_response(search_file.content)
+                _serve_stale(response, search_file.data_timestamp)
+                return response
+        else:
+            content = search_file.content
+            _remember_response(f"search:{search.cache_key}", search_file, content)
+
+    # Fetch the next page ahead of the user asking for it. Cached results are
+    # sent as stored, so they are only parsed when the next page isn't cached.
+    next_search = search.next_page()
+    if (
+        not _response_cache.contains(f"search:{next_search.cache_key}")
+        and _has_next_page(content)
+        and not _is_search_cached(session, next_search)
+    ):
+        background_tasks.add_task(
+            _prefetch_search,
+            next_search,
+            anilist_token,
+            background,
         )
+    response = _json_response(content)
+    if stale_since is not None:
+        _serve_stale(response, stale_since)
+    return response
+
 
-    return SearchPage.model_validate_json(search_file.content)
+@router.get("/anilist/usage", tags=["anilist"])
+def read_anilist_usage(client: ClientKey) -> ClientUsage:
+    """
+    Retrieve the caller's share of this worker's AniList request budget.
+    """
+    return _scheduler.usage(client)
@@ -0,0 +1,208 @@
+"""Priority-aware, fair-share scheduling of AniList requests."""
+
+import itertools
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from app.media.rate_limit import RateLimiter
+
+# Clients are compared on the slots they were granted over this many seconds.
+_USAGE_WINDOW = 600.0
+
+
+class RequestPriority(IntEnum):
+    """How urgently a request needs an AniList slot; lower is more urgent."""
+
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+@dataclass(frozen=True)
+class Requester:
+    """Who is asking for an AniList slot and how urgently."""
+
+    client: str = "server"
+    priority: RequestPriority = RequestPriority.NORMAL
+
+
+@dataclass(eq=False)
+class _Waiter:
+    requester: Requester
+    sequence: int
+    # Start tag in the fair queue: where this request sits in its client's
+    # share of the virtual clock.
+    start_tag: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True)
+class ClientUsage:
+    """How much of the shared AniList budget a client is using."""
+
+    client: str
+    waiting: int
+    in_flight: int
+    recent_slots: int
+    recent_share: float
+    active_clients: int
+
+
+class PriorityScheduler:
+    """Hands out rate limit slots by priority, then fairly between clients.
+
+    Only one request per process waits on the rate limiter at a time; the rest
+    queue here. Each slot goes to the most urgent priority class, and within a
+    class to the client with the smallest weighted share so far (start-time
+    fair queuing), first come first served within a client. A waiter moves up
+    one class for every ``aging_seconds`` it has waited so bulk work is delayed
+    but never starved. A client can't have more than ``max_in_flight`` requests
+    holding slots at once.
+    """
+
+    def __init__(
+        self,
+        rate_limiter: RateLimiter,
+        aging_seconds: float,
+        max_in_flight: int,
+        weights: dict[str, float] | None = None,
+    ) -> None:
+        self._rate_limiter = rate_limiter
+        self._aging_seconds = aging_seconds
+        self._max_in_flight = max_in_flight
+        self._weights = weights or {}
+        self._condition = threading.Condition()
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._reserving = False
+        # Virtual clock: the start tag of the most recently granted request.
+        self._virtual_time = 0.0
+        self._finish_tags: dict[str, float] = {}
+        self._in_flight: Counter[str] = Counter()
+        self._grants: deque[tuple[float, str]] = deque()
+
+    def acquire(self, requester: Requester) -> None:
+        """Block until ``requester`` may issue its next request.
+
+        Every call must be paired with :meth:`release` once the request is done.
+        """
+        with self._condition:
+            start_tag = max(
+                self._finish_tags.get(requester.client, 0.0),
+                self._virtual_time,
+            )
+            self._finish_tags[requester.client] = start_tag + 1 / self._weights.get(
+                requester.client,
+                1.0,
+            )
+            waiter = _Waiter(requester, next(self._sequence), start_tag)
+            self._waiters.append(waiter)
+            while self._reserving or self._next_waiter() is not waiter:
+                self._condition.wait()
+            self._waiters.remove(waiter)
+            self._reserving = True
+            self._virtual_time = start_tag
+            self._in_flight[requester.client] += 1
+
+        reserved = False
+        try:
+            self._rate_limiter.reserve_slot()
+            reserved = True
+        finally:
+            with self._condition:
+                self._reserving = False
+                if reserved:
+                    self._record_grant(requester.client)
+                else:
+                    self._release(requester.client)
+                self._condition.notify_all()
+
+    def release(self, requester: Requester) -> None:
+        with self._condition:
+            self._release(requester.client)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, requester: Requester) -> Iterator[None]:
+        """Hold a slot for ``requester`` for the duration of the block."""
+        self.acquire(requester)
+        try:
+            yield
+        finally:
+            self.release(requester)
+
+    def queue_lengths(self) -> dict[RequestPriority, int]:
+        """Number of requests waiting for a slot, by priority."""
+        with self._condition:
+            return {
+                priority: sum(
+                    waiter.requester.priority == priority for waiter in self._waiters
+                )
+                for priority in RequestPriority
+            }
+
+    def usage(self, client: str) -> ClientUsage:
+        """Current queue position and recent share of the budget for ``client``."""
+        with self._condition:
+            self._expire_grants()
+            recent = Counter(grant_client for _, grant_client in self._grants)
+            active = {waiter.requester.client for waiter in self._waiters}
+            active.update(self._in_flight)
+            return ClientUsage(
+                client=client,
+                waiting=sum(
+                    waiter.requester.client == client for waiter in self._waiters
+                ),
+                in_flight=self._in_flight[client],
+                recent_slots=recent[client],
+                recent_share=recent[client] / len(self._grants) if self._grants else 0,
+                active_clients=len(active),
+            )
+
+    def _next_waiter(self) -> _Waiter | None:
+        now = time.monotonic()
+
+        def rank(waiter: _Waiter) -> tuple[int, float, int]:
+            promotions = int((now - waiter.enqueued_at) / self._aging_seconds)
+            return (
+                max(0, waiter.requester.priority - promotions),
+                waiter.start_tag,
+                waiter.sequence,
+            )
+
+        eligible = [
+            waiter
+            for waiter in self._waiters
+            if self._in_flight[waiter.requester.client] < self._max_in_flight
+        ]
+        return min(eligible, key=rank, default=None)
+
+    def _release(self, client: str) -> None:
+        self._in_flight[client] -= 1
+        if self._in_flight[client] <= 0:
+            del self._in_flight[client]
+
+    def _record_grant(self, client: str) -> None:
+        self._grants.append((time.monotonic(), client))
+        self._expire_grants()
+
+        # Forget clients that have caught up with the virtual clock and have
+        # nothing queued; they rejoin at the current virtual time.
+        busy = {waiter.requester.client for waiter in self._waiters}
+        busy.update(self._in_flight)
+        for idle_client in [
+            idle_client
+            for idle_client, finish_tag in self._finish_tags.items()
+            if finish_tag <= self._virtual_time and idle_client not in busy
+        ]:
+            del self._finish_tags[idle_client]
+
+    def _expire_grants(self) -> None:
+        cutoff = time.monotonic() - _USAGE_WINDOW
+        while self._grants and self._grants[0][0] < cutoff:
+            self._grants.popleft()
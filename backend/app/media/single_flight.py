@@ -0,0 +1,88 @@
+"""Coalesce concurrent cache misses so each key is downloaded only once."""
+
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future
+
+from sqlmodel import Session, func, select
+
+
+class SingleFlight[T]:
+    """Runs one call per key at a time and shares its result with every waiter.
+
+    The first thread to ask for a key does the work; threads that ask for the
+    same key while it is running block and receive the same result or
+    exception instead of repeating it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future[T]] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def lock_keys(session: Session, keys: Iterable[str]) -> None:
+    """Hold Postgres advisory locks on ``keys`` until the transaction ends.
+
+    Keys are locked in sorted order so callers locking overlapping sets can't
+    deadlock each other.
+    """
+    for key in sorted(set(keys)):
+        session.exec(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+
+
+def try_lock_keys(session: Session, keys: Iterable[str]) -> list[str]:
+    """Hold the Postgres advisory locks on ``keys`` that nobody else holds.
+
+    Like :func:`lock_keys`, but never waits: returns the keys whose locks were
+    taken, which are held until the transaction ends.
+    """
+    locked = []
+    for key in sorted(set(keys)):
+        statement = select(func.pg_try_advisory_xact_lock(func.hashtext(key)))
+        if session.exec(statement).one():
+            locked.append(key)
+    return locked
+
+
+def wait_for_key(
+    session: Session,
+    key: str,
+    initial_delay: float = 0.05,
+    max_delay: float = 1.0,
+) -> None:
+    """Take the Postgres advisory lock on ``key``, polling until it is free.
+
+    Unlike :func:`lock_keys`, the session's transaction is rolled back between
+    attempts, so a waiter gives its connection back to the pool instead of
+    holding it until the lock is released. Attempts back off exponentially
+    from ``initial_delay`` up to ``max_delay`` seconds.
+    """
+    delay = initial_delay
+    while not try_lock_keys(session, [key]):
+        session.rollback()
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
@@ -0,0 +1,67 @@
+"""Train a zstd dictionary on the cached user lists.
+
+Run with ``python -m app.media.train_dictionary``. Lists stored from then on
+with ANILIST_USER_LIST_COMPRESSION set to "zstd" use the new dictionary; lists
+stored with an older one keep it until they are refreshed.
+"""
+
+import argparse
+import logging
+from collections.abc import Iterator, Sequence
+
+from sqlmodel import Session, col, select
+
+from app.database import engine
+from app.media.models import UserFile
+from app.media.payloads import load_user_list, train_dictionary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def user_list_samples(session: Session, limit: int) -> Iterator[bytes]:
+    """Up to ``limit`` of the most recently downloaded user lists, as JSON."""
+    statement = (
+        select(UserFile)
+        .order_by(col(UserFile.data_timestamp).desc().nulls_last())
+        .limit(limit)
+    )
+    for user_file in session.exec(statement):
+        content = load_user_list(session, user_file)
+        yield content.encode() if isinstance(content, str) else content
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Train a zstd dictionary on the cached user lists.",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1000,
+        help="how many user lists to train on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=112_640,
+        help="dictionary size in bytes (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    with Session(engine) as session:
+        samples = list(user_list_samples(session, args.samples))
+        if not samples:
+            logger.warning("No cached user lists to train on")
+            return
+        dictionary = train_dictionary(session, samples, args.size)
+        session.commit()
+    logger.info(
+        "Trained dictionary %s on %d user lists",
+        dictionary.id,
+        len(samples),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""How long each kind of cached AniList data stays fresh."""
+
+import json
+import random
+from abc import ABC, abstractmethod
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from app.media.models import BaseMetadataMixin, MediaFile, UserFile
+
+# Up to this share of a lifetime is taken off at random, so entries downloaded
+# together don't all expire together.
+_EXPIRY_JITTER = 0.2
+
+
+class TtlPolicy[T: BaseMetadataMixin](ABC):
+    """Decides how long a freshly downloaded cache entry stays fresh."""
+
+    @abstractmethod
+    def max_age(self, cache_file: T) -> timedelta:
+        """Lifetime of ``cache_file`` as of its ``data_timestamp``."""
+
+    def expires_at(self, cache_file: T) -> datetime | None:
+        """When ``cache_file`` is due for a refresh, with jitter applied."""
+        if cache_file.data_timestamp is None:
+            return None
+        jitter = 1 - _EXPIRY_JITTER * random.random()  # noqa: S311
+        return cache_file.data_timestamp + self.max_age(cache_file) * jitter
+
+
+class FixedTtlPolicy[T: BaseMetadataMixin](TtlPolicy[T]):
+    def __init__(self, max_age: timedelta) -> None:
+        self._max_age = max_age
+
+    def max_age(self, cache_file: T) -> timedelta:  # noqa: ARG002
+        return self._max_age
+
+
+def _since_change(
+    cache_file: BaseMetadataMixin,
+    changed_at: int | None,
+) -> timedelta | None:
+    """Time between the last change on AniList and the download."""
+    if changed_at is None or cache_file.data_timestamp is None:
+        return None
+    return cache_file.data_timestamp - datetime.fromtimestamp(changed_at, UTC)
+
+
+def _fuzzy_date_end(date: dict[str, Any] | None) -> datetime | None:
+    """Roughly when an AniList FuzzyDate ends, erring late."""
+    if not date or not date.get("year"):
+        return None
+    month = date.get("month") or 12
+    day = date.get("day") or 28
+    return datetime(date["year"], month, day, tzinfo=UTC)
+
+
+class MediaTtlPolicy(TtlPolicy[MediaFile]):
+    """Media that are airing or about to change are refreshed more often.
+
+    The lifetime follows the media's status: short while it is releasing or
+    announced, ``finished`` once it is over and ``settled`` for media that
+    ended more than ``settle_after`` ago. It is then capped at
+    ``change_fraction`` of how long the media had gone unchanged on AniList
+    (but never below ``minimum``), so recently edited media are checked again
+    sooner.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        status_max_age: dict[str, timedelta] | None = None,
+        finished: timedelta = timedelta(days=30),
+        settled: timedelta = timedelta(days=180),
+        settle_after: timedelta = timedelta(days=365),
+        minimum: timedelta = timedelta(hours=12),
+        change_fraction: float = 0.1,
+    ) -> None:
+        self._status_max_age = status_max_age or {
+            "RELEASING": timedelta(days=1),
+            "NOT_YET_RELEASED": timedelta(days=3),
+            "HIATUS": timedelta(days=7),
+        }
+        self._finished = finished
+        self._settled = settled
+        self._settle_after = settle_after
+        self._minimum = minimum
+        self._change_fraction = change_fraction
+
+    def max_age(self, cache_file: MediaFile) -> timedelta:
+        content = json.loads(cache_file.content)
+        max_age = self._status_max_age.get(content.get("status") or "")
+        if max_age is None:
+            ended = _fuzzy_date_end(content.get("endDate"))
+            settled = (
+                ended is not None
+                and cache_file.data_timestamp is not None
+                and cache_file.data_timestamp - ended > self._settle_after
+            )
+            max_age = self._settled if settled else self._finished
+
+        since_change = _since_change(cache_file, cache_file.anilist_updated_at)
+        if since_change is not None:
+            max_age = min(
+                max_age,
+                max(self._minimum, since_change * self._change_fraction),
+            )
+        return max_age
+
+
+class UserListTtlPolicy(TtlPolicy[UserFile]):
+    """Lists their owner keeps updating are refreshed more often.
+
+    The lifetime is ``change_fraction`` of how long the list had gone without
+    an entry update, between ``minimum`` and ``maximum``.
+    """
+
+    def __init__(
+        self,
+        *,
+        minimum: timedelta = timedelta(hours=6),
+        maximum: timedelta = timedelta(days=30),
+        change_fraction: float = 0.1,
+    ) -> None:
+        self._minimum = minimum
+        self._maximum = maximum
+        self._change_fraction = change_fraction
+
+    def max_age(self, cache_file: UserFile) -> timedelta:
+        since_change = _since_change(cache_file, cache_file.list_updated_at)
+        if since_change is None:
+            return self._maximum
+        return min(
+            self._maximum,
+            max(self._minimum, since_change * self._change_fraction),
+        )
@@ -0,0 +1,174 @@
+"""Pre-populate the media cache with popular, trending and current-season media.
+
+Run with ``python -m app.media.warm_up``. Progress is checkpointed to a file
+after every page, so an interrupted run picks up where it stopped; the file is
+removed once a run completes. Requests go out at background priority through
+the shared rate limiter; set ANILIST_PROCESS_MAX_REQUESTS_PER_MINUTE as well to
+leave live traffic most of the AniList budget. While AniList is unavailable the
+run waits for it rather than giving up.
+"""
+
+import argparse
+import json
+import logging
+import time
+from collections.abc import Sequence
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+from pydantic import TypeAdapter, ValidationError
+from sqlmodel import Session
+
+from app.database import engine
+from app.media import router
+from app.media.circuit_breaker import AnilistUnavailableError
+from app.media.queries import WARM_UP_PER_PAGE, WARM_UP_QUERY
+from app.media.scheduler import Requester, RequestPriority
+from app.utils import tz_datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WARM_UP_SOURCES = ("popular", "trending", "season")
+
+_WARM_UP = Requester("warm-up", RequestPriority.BACKGROUND)
+
+_checkpoint_adapter = TypeAdapter(dict[str, int])
+
+
+def current_season(today: date) -> tuple[str, int]:
+    """AniList season and season year of ``today``; December is next WINTER."""
+    if today.month == 12:  # noqa: PLR2004
+        return "WINTER", today.year + 1
+    seasons = ("WINTER", "SPRING", "SUMMER", "FALL")
+    return seasons[today.month // 3], today.year
+
+
+def _source_variables(source: str, today: date) -> dict[str, Any]:
+    if source == "popular":
+        return {"sort": ["POPULARITY_DESC"]}
+    if source == "trending":
+        return {"sort": ["TRENDING_DESC"]}
+    season, season_year = current_season(today)
+    return {"sort": ["POPULARITY_DESC"], "season": season, "seasonYear": season_year}
+
+
+def _checkpoint_key(source: str, today: date, limit: int) -> str:
+    """Where a run left off depends on the season and limit it ran with."""
+    if source == "season":
+        season, season_year = current_season(today)
+        return f"{source}:{season}:{season_year}:{limit}"
+    return f"{source}:{limit}"
+
+
+def _load_checkpoint(path: Path) -> dict[str, int]:
+    """Next page to fetch per source, from an earlier, interrupted run."""
+    try:
+        return _checkpoint_adapter.validate_json(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except ValidationError:
+        logger.warning("Ignoring invalid warm-up checkpoint %s", path)
+        return {}
+
+
+def _save_checkpoint(path: Path, next_pages: dict[str, int]) -> None:
+    partial = path.with_name(f"{path.name}.partial")
+    partial.write_text(json.dumps(next_pages))
+    partial.replace(path)
+
+
+def warm_up(
+    session: Session,
+    sources: Sequence[str],
+    limit: int,
+    checkpoint: Path,
+) -> int:
+    """Cache the top ``limit`` media of each source; returns how many were seen.
+
+    Media already cached and fresh cost nothing beyond the page listing them.
+    """
+    next_pages = _load_checkpoint(checkpoint)
+    today = tz_datetime.now().date()
+    seen = 0
+    for source in sources:
+        key = _checkpoint_key(source, today, limit)
+        page = next_pages.get(key, 1)
+        while page and (page - 1) * WARM_UP_PER_PAGE < limit:
+            try:
+                graphql_data = router.graphql_request(
+                    WARM_UP_QUERY,
+                    {
+                        **_source_variables(source, today),
+                        "page": page,
+                        "perPage": WARM_UP_PER_PAGE,
+                    },
+                    requester=_WARM_UP,
+                )
+                result = graphql_data["data"]["Page"]
+                media_ids = [media["id"] for media in result["media"] or [] if media]
+                media_ids = media_ids[: limit - (page - 1) * WARM_UP_PER_PAGE]
+                router.fetch_media(session, media_ids, requester=_WARM_UP)
+            except AnilistUnavailableError as e:
+                # Media stored before the error are kept; the page is retried.
+                session.rollback()
+                logger.warning("%s; retrying in %.0fs", e, e.retry_after)
+                time.sleep(max(e.retry_after, 1.0))
+                continue
+            seen += len(media_ids)
+
+            logger.info("Warmed up %s media, page %d", source, page)
+            # 0 marks a source without further pages.
+            page = page + 1 if result["pageInfo"]["hasNextPage"] else 0
+            next_pages[key] = page
+            _save_checkpoint(checkpoint, next_pages)
+    checkpoint.unlink(missing_ok=True)
+    return seen
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Pre-populate the media cache from AniList.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=500,
+        help="how many media to cache from each source (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        choices=WARM_UP_SOURCES,
+        dest="sources",
+        help="media to cache; may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=Path("warm_up_checkpoint.json"),
+        help="file recording progress (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the checkpoint and start from the first page",
+    )
+    args = parser.parse_args(argv)
+
+    if args.restart:
+        args.checkpoint.unlink(missing_ok=True)
+    logger.info("Warming up the media cache")
+    with Session(engine) as session:
+        seen = warm_up(
+            session,
+            args.sources or WARM_UP_SOURCES,
+            args.limit,
+            args.checkpoint,
+        )
+    logger.info("Media cache warmed up; %d media checked", seen)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+from collections.abc import Generator
+
+import pytest
+
+from app.media import router
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache() -> Generator[None]:
+    """Each test's rows are rolled back, so their cached responses must go too."""
+    yield
+    router._response_cache.clear()
@@ -0,0 +1,30 @@
+import anyio
+
+from app.media.anilist_client import AnilistClients
+
+
+def test_clients_are_reused() -> None:
+    clients = AnilistClients()
+
+    assert clients.sync_client() is clients.sync_client()
+    assert clients.async_client() is clients.async_client()
+
+    clients.close()
+
+
+async def _close(clients: AnilistClients) -> None:
+    await clients.aclose()
+
+
+def test_aclose_reopens_lazily() -> None:
+    clients = AnilistClients()
+    sync_client = clients.sync_client()
+    async_client = clients.async_client()
+
+    anyio.run(_close, clients)
+
+    assert sync_client.is_closed
+    assert async_client.is_closed
+    assert clients.sync_client() is not sync_client
+
+    clients.close()
@@ -0,0 +1,38 @@
+import queue
+
+from sqlmodel import Session
+
+from app.media.invalidation import (
+    RESET,
+    InvalidationListener,
+    connect_listener,
+    publish,
+)
+from tests.conftest import test_engine
+
+
+def test_listener_receives_committed_changes() -> None:
+    changes: queue.Queue[str] = queue.Queue()
+    listener = InvalidationListener(
+        lambda: connect_listener(test_engine),
+        changes.put,
+        lambda: changes.put(RESET),
+    )
+    listener.start()
+    try:
+        # The listener resets once it is connected.
+        assert changes.get(timeout=5) == RESET
+
+        with Session(test_engine) as session:
+            publish(session, "media:1")
+            session.rollback()
+            publish(session, "media:2")
+            publish(session, f"search:{'x' * 8000}")
+            session.commit()
+
+        assert changes.get(timeout=5) == "media:2"
+        # Keys too long to send make every listener drop everything.
+        assert changes.get(timeout=5) == RESET
+        assert changes.empty()
+    finally:
+        listener.stop(timeout=5)
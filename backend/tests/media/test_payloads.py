@@ -0,0 +1,85 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.config import settings
+from app.media.models import UserFile
+from app.media.payloads import load_user_list, store_user_list, train_dictionary
+from app.media.train_dictionary import user_list_samples
+from tests.media.test_router import MOCK_USER_RESPONSE
+
+
+def _user_list(index: int) -> str:
+    entries = [
+        {"mediaId": index * 100 + entry, "status": "COMPLETED", "score": entry % 10}
+        for entry in range(50)
+    ]
+    return json.dumps({"lists": [{"entries": entries, "status": "COMPLETED"}]})
+
+
+@pytest.fixture
+def compress_user_lists(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "ANILIST_USER_LIST_COMPRESSION", "zstd")
+
+
+def test_user_lists_are_stored_as_json_by_default(
+    session_scoped_db: Session,
+) -> None:
+    user_file = UserFile(id="plainuser")
+    store_user_list(session_scoped_db, user_file, _user_list(1))
+
+    assert user_file.content_format == "json"
+    assert user_file.compressed_content is None
+    assert load_user_list(session_scoped_db, user_file) == _user_list(1)
+
+
+@pytest.mark.usefixtures("compress_user_lists")
+def test_compressed_user_lists_use_the_newest_dictionary(
+    session_scoped_db: Session,
+) -> None:
+    without_dictionary = UserFile(id="zstduser")
+    store_user_list(session_scoped_db, without_dictionary, _user_list(1))
+    assert without_dictionary.content_format == "zstd"
+    assert without_dictionary.content is None
+    assert without_dictionary.dictionary_id is None
+
+    samples = [_user_list(index).encode() for index in range(2, 200)]
+    dictionary = train_dictionary(session_scoped_db, samples, 4096)
+    with_dictionary = UserFile(id="zstduser")
+    store_user_list(session_scoped_db, with_dictionary, _user_list(1))
+    assert with_dictionary.dictionary_id == dictionary.id
+    assert with_dictionary.compressed_content is not None
+    assert without_dictionary.compressed_content is not None
+    assert len(with_dictionary.compressed_content) < len(
+        without_dictionary.compressed_content,
+    )
+
+    # Lists stored before the dictionary was trained are still read.
+    for user_file in (without_dictionary, with_dictionary):
+        content = load_user_list(session_scoped_db, user_file)
+        assert content == _user_list(1).encode()
+
+
+@pytest.mark.usefixtures("compress_user_lists")
+@patch("app.media.router.graphql_request")
+def test_read_user_serves_compressed_list(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    mock_graphql.return_value = MOCK_USER_RESPONSE  # type: ignore[attr-defined]
+
+    downloaded = session_scoped_client.get(f"{settings.API_V1_STR}/user/zstdreader")
+    cached = session_scoped_client.get(f"{settings.API_V1_STR}/user/zstdreader")
+    assert cached.status_code == status.HTTP_200_OK
+    assert cached.json() == downloaded.json()
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+
+    user_file = session_scoped_db.get(UserFile, "zstdreader")
+    assert user_file is not None
+    assert user_file.content_format == "zstd"
+    assert list(user_list_samples(session_scoped_db, 1)) == [cached.content]
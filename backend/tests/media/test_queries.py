@@ -0,0 +1,8 @@
+from app.media.queries import MEDIA_QUERY, NEIGHBOR_FIELDS
+
+
+def test_neighbors_use_slim_fields() -> None:
+    assert MEDIA_QUERY.count("...NeighborFields") == 2
+    assert "fragment NeighborFields on Media {" + NEIGHBOR_FIELDS in MEDIA_QUERY
+    for field in ("description", "externalLinks", "rankings", "studios"):
+        assert field not in NEIGHBOR_FIELDS
@@ -0,0 +1,130 @@
+import time
+
+import httpx
+from sqlmodel import Session
+
+from app.database import engine
+from app.media.models import RateLimitState
+from app.media.rate_limit import (
+    CappedRateLimiter,
+    LocalRateLimiter,
+    LocalTokenBucketRateLimiter,
+    PostgresRateLimiter,
+    PostgresTokenBucketRateLimiter,
+    RateLimiter,
+    rate_limit_engine,
+)
+from tests.conftest import test_engine
+from tests.utils.utils import random_lower_string
+
+
+def _timed_reserve(limiter: RateLimiter) -> float:
+    start = time.monotonic()
+    limiter.reserve_slot()
+    return time.monotonic() - start
+
+
+def test_local_rate_limiter_spaces_requests() -> None:
+    limiter = LocalRateLimiter(600)
+
+    assert _timed_reserve(limiter) < 0.05
+    assert _timed_reserve(limiter) >= 0.05
+
+
+def test_local_rate_limiter_learns_limit() -> None:
+    limiter = LocalRateLimiter(1)
+    limiter.learn_limit(httpx.Headers({"X-RateLimit-Limit": "6000"}))
+
+    limiter.reserve_slot()
+    assert _timed_reserve(limiter) < 0.05
+
+
+def test_postgres_rate_limiter_shares_budget() -> None:
+    name = random_lower_string()
+    first = PostgresRateLimiter(600, test_engine, name)
+    second = PostgresRateLimiter(600, test_engine, name)
+
+    assert _timed_reserve(first) < 0.05
+    assert _timed_reserve(second) >= 0.05
+
+
+def test_postgres_rate_limiter_persists_cooldown() -> None:
+    name = random_lower_string()
+    PostgresRateLimiter(6000, test_engine, name).apply_cooldown(0.2)
+
+    # A fresh limiter, e.g. after a restart, still honours the cooldown.
+    assert _timed_reserve(PostgresRateLimiter(6000, test_engine, name)) >= 0.1
+
+    with Session(test_engine) as session:
+        state = session.get(RateLimitState, name)
+        assert state is not None
+        assert state.min_interval == 0.01
+
+
+def test_local_token_bucket_bursts_then_waits() -> None:
+    # 600 rpm less a margin of 597 leaves a burst of 3.
+    limiter = LocalTokenBucketRateLimiter(600, 597)
+
+    assert sum(_timed_reserve(limiter) for _ in range(3)) < 0.05
+    assert _timed_reserve(limiter) >= 0.05
+
+
+def test_local_token_bucket_follows_remaining_header() -> None:
+    limiter = LocalTokenBucketRateLimiter(600, 2)
+    limiter.learn_remaining(httpx.Headers({"X-RateLimit-Remaining": "3"}))
+
+    assert _timed_reserve(limiter) < 0.05
+    assert _timed_reserve(limiter) >= 0.05
+
+
+def test_local_token_bucket_waits_for_reset_when_drained() -> None:
+    limiter = LocalTokenBucketRateLimiter(6000, 0)
+    limiter.learn_remaining(
+        httpx.Headers(
+            {
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": str(time.time() + 0.2),
+            },
+        ),
+    )
+
+    assert _timed_reserve(limiter) >= 0.1
+
+
+def test_postgres_token_bucket_shares_burst() -> None:
+    name = random_lower_string()
+    first = PostgresTokenBucketRateLimiter(600, 597, test_engine, name)
+    second = PostgresTokenBucketRateLimiter(600, 597, test_engine, name)
+
+    assert _timed_reserve(first) + _timed_reserve(second) < 0.05
+    assert _timed_reserve(first) < 0.05
+    assert _timed_reserve(second) >= 0.05
+
+
+def test_postgres_token_bucket_follows_remaining_header() -> None:
+    name = random_lower_string()
+    limiter = PostgresTokenBucketRateLimiter(600, 2, test_engine, name)
+    limiter.reserve_slot()
+    limiter.learn_remaining(httpx.Headers({"X-RateLimit-Remaining": "2"}))
+
+    assert _timed_reserve(limiter) >= 0.05
+
+
+def test_capped_rate_limiter_spaces_this_process() -> None:
+    shared = LocalTokenBucketRateLimiter(6000, safety_margin=0)
+    limiter = CappedRateLimiter(shared, 600)
+
+    assert _timed_reserve(limiter) < 0.05
+    assert _timed_reserve(limiter) >= 0.05
+
+    # Learned limits and cooldowns go to the shared budget.
+    limiter.learn_limit(httpx.Headers({"X-RateLimit-Limit": "60"}))
+    limiter.apply_cooldown(0.1)
+    assert _timed_reserve(shared) >= 0.05
+
+
+def test_shared_rate_limiters_use_their_own_pool() -> None:
+    # Request threads waiting for a slot each hold a connection from the main
+    # pool already.
+    assert PostgresRateLimiter(600)._engine is not engine
+    assert PostgresRateLimiter(600)._engine is rate_limit_engine
@@ -0,0 +1,29 @@
+import threading
+
+from app.media.refresh import PeriodicRefresher
+
+
+def test_refresher_runs_until_stopped() -> None:
+    runs = threading.Semaphore(0)
+
+    def refresh() -> None:
+        runs.release()
+        msg = "AniList is down"
+        raise RuntimeError(msg)
+
+    refresher = PeriodicRefresher("test", refresh, interval=0.01)
+    refresher.start()
+    # Failures are logged and don't stop the next run.
+    assert runs.acquire(timeout=1)
+    assert runs.acquire(timeout=1)
+    refresher.stop(timeout=1)
+
+    while runs.acquire(blocking=False):
+        pass
+    assert not runs.acquire(timeout=0.05)
+
+
+def test_refresher_with_no_interval_never_starts() -> None:
+    refresher = PeriodicRefresher("test", lambda: None, interval=0)
+    refresher.start()
+    assert refresher._thread is None
@@ -0,0 +1,92 @@
+from app.media.response_cache import ResponseCache
+
+# Every entry takes up its key, body and this much bookkeeping.
+OVERHEAD = 128
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _entry_size(key: str, body: bytes) -> int:
+    return len(key) + len(body) + OVERHEAD
+
+
+def test_entries_expire_after_their_ttl() -> None:
+    clock = FakeClock()
+    cache = ResponseCache(10_000, clock=clock)
+    assert cache.put("media:1", b"{}", ttl=60)
+
+    clock.now = 59
+    assert cache.get("media:1") == b"{}"
+    clock.now = 60
+    assert cache.get("media:1") is None
+    assert cache.size == 0
+
+
+def test_contains_honours_expiry() -> None:
+    clock = FakeClock()
+    cache = ResponseCache(10_000, clock=clock)
+    assert not cache.contains("search:a")
+    assert cache.put("search:a", b"{}", ttl=60)
+    assert cache.contains("search:a")
+    clock.now = 60
+    assert not cache.contains("search:a")
+
+
+def test_cache_stays_within_its_byte_bound() -> None:
+    body = b"x" * 100
+    cache = ResponseCache(3 * _entry_size("media:1", body), max_entry_bytes=1000)
+    for media_id in range(1, 4):
+        assert cache.put(f"media:{media_id}", body, ttl=60)
+    cache.get("media:1")
+    cache.get("media:4")
+    cache.get("media:4")
+
+    # media:2 is the least recently used, and asked for less than media:4.
+    assert cache.put("media:4", body, ttl=60)
+    assert cache.size == 3 * _entry_size("media:1", body)
+    assert cache.get("media:2") is None
+    assert cache.get("media:1") == body
+
+
+def test_scan_of_one_off_keys_does_not_flush_popular_entries() -> None:
+    body = b"x" * 100
+    cache = ResponseCache(2 * _entry_size("media:1", body), max_entry_bytes=1000)
+    for key in ("media:1", "media:2"):
+        for _ in range(5):
+            cache.get(key)
+        cache.put(key, body, ttl=60)
+
+    for media_id in range(100, 200):
+        key = f"media:{media_id}"
+        assert cache.get(key) is None
+        assert not cache.put(key, body, ttl=60)
+    assert cache.get("media:1") == body
+    assert cache.get("media:2") == body
+
+
+def test_expired_entries_are_evicted_whatever_their_frequency() -> None:
+    clock = FakeClock()
+    body = b"x" * 100
+    cache = ResponseCache(
+        _entry_size("media:1", body), max_entry_bytes=1000, clock=clock
+    )
+    for _ in range(5):
+        cache.get("media:1")
+    cache.put("media:1", body, ttl=60)
+
+    clock.now = 61
+    assert cache.put("media:2", body, ttl=60)
+    assert cache.get("media:2") == body
+
+
+def test_oversized_and_disabled() -> None:
+    assert not ResponseCache(1600).put("user:big", b"x" * 100, ttl=60)
+    disabled = ResponseCache(0)
+    assert not disabled.put("media:1", b"{}", ttl=60)
+    assert disabled.get("media:1") is None
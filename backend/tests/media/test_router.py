@@ -1,11 +1,32 @@
+import json
+from datetime import timedelta
 from unittest.mock import patch
 
+import httpx
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, col, select
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from app.config import settings
-from app.media.models import MediaFile, UserFile
+from app.main import app
+from app.media import router
+from app.media.circuit_breaker import AnilistUnavailableError, CircuitBreaker
+from app.media.models import (
+    MediaFile,
+    MediaNode,
+    MediaRecommendation,
+    SearchFile,
+    UserFile,
+)
+from app.media.single_flight import lock_keys
+from app.utils import tz_datetime
+from tests.conftest import test_engine
+from tests.utils.utils import random_lower_string
+
+# Rows downloaded this long ago without an expiry are past the stale grace.
+_PAST_STALE_GRACE = router.MAX_CACHE_AGE + router.STALE_GRACE + timedelta(days=1)
 
 MOCK_MEDIA_RESPONSE = {
     "data": {
@@ -128,9 +149,10 @@ MOCK_MEDIA_RESPONSE = {
     },
 }
 
-MOCK_USER_RESPONSE_ANIME = {
+MOCK_USER_RESPONSE = {
     "data": {
-        "MediaListCollection": {
+        "anime": {
+            "hasNextChunk": False,
             "lists": [
                 {
                     "entries": [{"mediaId": 1}, {"mediaId": 5}],
@@ -142,12 +164,8 @@ MOCK_USER_RESPONSE_ANIME = {
                 },
             ],
         },
-    },
-}
-
-MOCK_USER_RESPONSE_MANGA = {
-    "data": {
-        "MediaListCollection": {
+        "manga": {
+            "hasNextChunk": False,
             "lists": [
                 {
                     "entries": [{"mediaId": 100}],
@@ -244,7 +262,7 @@ def test_read_user(
     session_scoped_client: TestClient,
     session_scoped_db: Session,
 ) -> None:
-    mock_graphql.side_effect = [MOCK_USER_RESPONSE_ANIME, MOCK_USER_RESPONSE_MANGA]  # type: ignore[attr-defined]
+    mock_graphql.return_value = MOCK_USER_RESPONSE  # type: ignore[attr-defined]
 
     response = session_scoped_client.get(
         f"{settings.API_V1_STR}/user/testuser",
@@ -262,7 +280,7 @@ def test_read_user_caches_response(
     session_scoped_client: TestClient,
     session_scoped_db: Session,
 ) -> None:
-    mock_graphql.side_effect = [MOCK_USER_RESPONSE_ANIME, MOCK_USER_RESPONSE_MANGA]  # type: ignore[attr-defined]
+    mock_graphql.return_value = MOCK_USER_RESPONSE  # type: ignore[attr-defined]
 
     response1 = session_scoped_client.get(
         f"{settings.API_V1_STR}/user/cacheuser",
@@ -274,8 +292,8 @@ def test_read_user_caches_response(
     )
     assert response2.status_code == status.HTTP_200_OK
 
-    # Should only call graphql twice (once for anime, once for manga) on first request
-    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
+    # Anime and manga lists come in a single request, on the first call only
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
 
     user_file = session_scoped_db.get(UserFile, "cacheuser")
     assert user_file is not None
@@ -287,7 +305,7 @@ def test_read_user_case_insensitive(
     session_scoped_client: TestClient,
     session_scoped_db: Session,
 ) -> None:
-    mock_graphql.side_effect = [MOCK_USER_RESPONSE_ANIME, MOCK_USER_RESPONSE_MANGA]  # type: ignore[attr-defined]
+    mock_graphql.return_value = MOCK_USER_RESPONSE  # type: ignore[attr-defined]
 
     response1 = session_scoped_client.get(
         f"{settings.API_V1_STR}/user/CaseUser",
@@ -300,7 +318,7 @@ def test_read_user_case_insensitive(
     )
     assert response2.status_code == status.HTTP_200_OK
 
-    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
 
 
 @patch("app.media.router.graphql_request")
@@ -367,3 +385,1085 @@ def test_read_media_graphql_error(
         f"{settings.API_V1_STR}/media/99999",
     )
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {"media0": {**media, "id": 1001}, "media1": None},
+        "errors": [{"message": "Not Found.", "status": 404}],
+    }
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1001, 1002, 1001]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [media["id"] for media in response.json()] == [1001]
+
+    # Both ids went out in one aliased query.
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+    variables = mock_graphql.call_args.args[1]  # type: ignore[attr-defined]
+    assert variables == {"id0": 1001, "id1": 1002}
+    assert session_scoped_db.get(MediaFile, 1001) is not None
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_splits_complex_queries(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        router.AnilistQueryTooComplexError("Max query complexity exceeded"),
+        {"data": {"media0": {**media, "id": 1011}}},
+        {"data": {"media0": {**media, "id": 1012}}},
+    ]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1011, 1012]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [media["id"] for media in response.json()] == [1011, 1012]
+    assert mock_graphql.call_count == 3  # type: ignore[attr-defined]
+
+
+def test_media_batch_splits_on_complexity_error_status(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    batch_sizes = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        variables = json.loads(request.content)["variables"]
+        batch_sizes.append(len(variables))
+        if len(variables) > 1:
+            return httpx.Response(
+                status.HTTP_400_BAD_REQUEST,
+                json={
+                    "data": None,
+                    "errors": [
+                        {"message": "Max query complexity exceeded", "status": 400},
+                    ],
+                },
+            )
+        return httpx.Response(
+            status.HTTP_200_OK,
+            json={"data": {"media0": {**media, "id": variables["id0"]}}},
+        )
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(router.anilist_clients, "sync_client", lambda: client)
+
+    downloaded, _ = router._fetch_media_batch([1013, 1014], None, router._SERVER)
+    assert list(downloaded) == [1013, 1014]
+    assert batch_sizes == [2, 1, 1]
+
+
+def test_parse_response_keeps_graphql_errors_of_error_status() -> None:
+    response = httpx.Response(
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+        json={"errors": [{"message": "Internal Server Error", "status": 500}]},
+    )
+    with pytest.raises(ValueError, match="Internal Server Error") as exc_info:
+        router._parse_response(response, allow_partial_errors=True)
+    assert not isinstance(exc_info.value, router.AnilistQueryTooComplexError)
+
+
+def test_read_anilist_usage(session_scoped_client: TestClient) -> None:
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/anilist/usage",
+        headers={"X-Anilist-Token": "secret"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    content = response.json()
+    assert content["client"].startswith("token:")
+    assert "secret" not in content["client"]
+    assert content["waiting"] == 0
+
+
+def test_anilist_usage_keys_proxied_clients_by_forwarded_address() -> None:
+    # As served by Uvicorn with FORWARDED_ALLOW_IPS set to Traefik's address.
+    headers = {"X-Forwarded-For": "203.0.113.7"}
+    url = f"{settings.API_V1_STR}/anilist/usage"
+
+    from_proxy = TestClient(ProxyHeadersMiddleware(app, trusted_hosts="testclient"))
+    response = from_proxy.get(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["client"] == "ip:203.0.113.7"
+
+    # Anyone else can't pick their own client key.
+    direct = TestClient(ProxyHeadersMiddleware(app, trusted_hosts="172.30.0.0/24"))
+    response = direct.get(url, headers=headers)
+    assert response.json()["client"] == "ip:testclient"
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_serves_stale_while_anilist_unavailable(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    mock_graphql.side_effect = AnilistUnavailableError("AniList is down", 30)  # type: ignore[attr-defined]
+    session_scoped_db.add(
+        MediaFile(
+            id=1021,
+            content=json.dumps(MOCK_MEDIA_RESPONSE["data"]["Media"]),
+            data_timestamp=tz_datetime.now() - _PAST_STALE_GRACE,
+        ),
+    )
+    session_scoped_db.commit()
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1021")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"]["romaji"] == "Cowboy Bebop"
+    assert response.headers["X-Cache-Status"] == "stale"
+    stale_limit = router.MAX_CACHE_AGE + router.STALE_GRACE
+    assert int(response.headers["Age"]) > stale_limit.total_seconds()
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_unavailable_without_cache(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    mock_graphql.side_effect = AnilistUnavailableError("AniList is down", 29.5)  # type: ignore[attr-defined]
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1022")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "30"
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_serves_what_it_has_while_anilist_unavailable(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    mock_graphql.side_effect = AnilistUnavailableError("AniList is down", 30)  # type: ignore[attr-defined]
+    session_scoped_db.add(_outdated_media_file(1022, 100))
+    # Never downloaded.
+    session_scoped_db.add(MediaFile(id=1023, content="{}"))
+    session_scoped_db.commit()
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1022, 1023, 1024]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [media["id"] for media in response.json()] == [1022]
+    assert response.headers["X-Cache-Status"] == "stale"
+    assert response.headers["X-Cache-Missing"] == "1023,1024"
+
+
+def test_graphql_request_fails_fast_once_circuit_opens(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(status.HTTP_502_BAD_GATEWAY)
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(router.anilist_clients, "sync_client", lambda: client)
+    monkeypatch.setattr(router, "_circuit_breaker", CircuitBreaker(2, 60))
+    monkeypatch.setattr(router, "_RETRY_BACKOFF_BASE", 0.001)
+
+    with pytest.raises(AnilistUnavailableError):
+        router.graphql_request(router.MEDIA_QUERY, {"mediaId": 1})
+    assert len(calls) == 2
+
+    with pytest.raises(AnilistUnavailableError) as exc_info:
+        router.graphql_request(router.MEDIA_QUERY, {"mediaId": 1})
+    assert len(calls) == 2
+    assert exc_info.value.retry_after > 0
+
+
+def test_read_media_serves_cached_content_as_stored(
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    content = '{"id":1031,"title":{"romaji":"Trigun"}}'
+    session_scoped_db.add(
+        MediaFile(id=1031, content=content, data_timestamp=tz_datetime.now()),
+    )
+    session_scoped_db.commit()
+
+    # Postgres normalises the JSONB it stores, but nothing is added or dropped
+    # by validating it against the response model.
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1031")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == json.loads(content)
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1031]},
+    )
+    assert response.json() == [json.loads(content)]
+
+
+def test_cached_content_can_be_queried_in_postgres(
+    session_scoped_db: Session,
+) -> None:
+    content = {**MOCK_MEDIA_RESPONSE["data"]["Media"], "id": 1032}
+    session_scoped_db.add(
+        MediaFile(
+            id=1032,
+            content=json.dumps(content),
+            data_timestamp=tz_datetime.now(),
+        ),
+    )
+    session_scoped_db.commit()
+
+    statement = select(MediaFile.id).where(
+        col(MediaFile.content).op("@>")(json.dumps({"status": "FINISHED"})),
+        MediaFile.id == 1032,
+    )
+    assert session_scoped_db.exec(statement).all() == [1032]
+
+
+def test_read_media_serves_repeated_hits_from_memory(
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    content = {"id": 1035, "title": {"romaji": "Trigun"}}
+    media_file = MediaFile(
+        id=1035,
+        content=json.dumps(content),
+        data_timestamp=tz_datetime.now(),
+        update_at=tz_datetime.now() + timedelta(days=1),
+    )
+    session_scoped_db.add(media_file)
+    session_scoped_db.commit()
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1035")
+    assert response.json() == content
+
+    # The second hit is answered without looking at the database.
+    session_scoped_db.delete(media_file)
+    session_scoped_db.commit()
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1035")
+    assert response.json() == content
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1035]},
+    )
+    assert response.json() == [content]
+
+
+def _media_with_neighbours(media_id: int, title: str) -> dict[str, object]:
+    neighbour = {"id": 1063, "title": {"romaji": title}}
+    return {
+        "data": {
+            "Media": {
+                "id": media_id,
+                "title": {"romaji": f"Media {media_id}"},
+                "recommendations": {
+                    "nodes": [
+                        {
+                            "id": media_id * 10,
+                            "rating": 7,
+                            "mediaRecommendation": neighbour,
+                        },
+                        {
+                            "id": media_id * 10 + 1,
+                            "rating": 3,
+                            "mediaRecommendation": None,
+                        },
+                    ],
+                },
+                "relations": {
+                    "edges": [{"relationType": "SEQUEL", "node": neighbour}],
+                },
+            },
+        },
+    }
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_stores_neighbours_once(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        _media_with_neighbours(1061, "Old title"),
+        _media_with_neighbours(1062, "New title"),
+    ]
+
+    session_scoped_client.get(f"{settings.API_V1_STR}/media/1061")
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1062")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["recommendations"] == {
+        "nodes": [
+            {
+                "id": 10620,
+                "rating": 7,
+                "mediaRecommendation": {"id": 1063, "title": {"romaji": "New title"}},
+            },
+        ],
+    }
+    assert response.json()["relations"] == {
+        "edges": [
+            {
+                "relationType": "SEQUEL",
+                "node": {"id": 1063, "title": {"romaji": "New title"}},
+            },
+        ],
+    }
+
+    # The shared neighbour is stored once, so both media see its latest copy.
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1061")
+    node = response.json()["recommendations"]["nodes"][0]
+    assert node["mediaRecommendation"]["title"]["romaji"] == "New title"
+    assert session_scoped_db.get(MediaNode, 1063) is not None
+    statement = select(MediaRecommendation.media_id).where(
+        MediaRecommendation.recommended_id == 1063,
+    )
+    assert sorted(session_scoped_db.exec(statement).all()) == [1061, 1062]
+    media_file = session_scoped_db.get(MediaFile, 1061)
+    assert media_file is not None
+    assert "nodes" not in json.loads(media_file.content)["recommendations"]
+
+
+def test_media_endpoints_document_media_schema(
+    session_scoped_client: TestClient,
+) -> None:
+    paths = session_scoped_client.get(f"{settings.API_V1_STR}/openapi.json").json()[
+        "paths"
+    ]
+    media_schema = paths[f"{settings.API_V1_STR}/media/{{media_id}}"]["get"][
+        "responses"
+    ]["200"]["content"]["application/json"]["schema"]
+    assert media_schema["$ref"].endswith("graphql_media_schema__Media")
+
+
+def _recommendation_page(first_id: int, ratings: list[int]) -> dict[str, object]:
+    return {
+        "recommendations": {
+            "nodes": [
+                {
+                    "id": first_id + index,
+                    "rating": rating,
+                    "mediaRecommendation": {"id": first_id + index},
+                }
+                for index, rating in enumerate(ratings)
+            ],
+        },
+    }
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_pages_through_recommendations(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    first_page = _recommendation_page(100, [50] * 25)["recommendations"]
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        {
+            "data": {
+                "Media": {
+                    **media,
+                    "id": 1041,
+                    "recommendations": {
+                        **first_page,
+                        "pageInfo": {"hasNextPage": True, "lastPage": 9},
+                    },
+                },
+            },
+        },
+        {
+            "data": {
+                # Page 3 drops below the minimum rating, so page 4 is left out.
+                "page0": _recommendation_page(200, [40] * 25),
+                "page1": _recommendation_page(300, [3, 2, 0, -1]),
+                "page2": _recommendation_page(400, [0]),
+            },
+        },
+    ]
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1041")
+    assert response.status_code == status.HTTP_200_OK
+    nodes = response.json()["recommendations"]["nodes"]
+    assert len(nodes) == 52
+    assert [node["rating"] for node in nodes[-3:]] == [40, 3, 2]
+    assert "pageInfo" not in response.json()["recommendations"]
+
+    # The pages up to ANILIST_MAX_RECOMMENDATIONS went out in one query.
+    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
+    variables = mock_graphql.call_args.args[1]  # type: ignore[attr-defined]
+    assert variables == {
+        "id0": 1041,
+        "page0": 2,
+        "id1": 1041,
+        "page1": 3,
+        "id2": 1041,
+        "page2": 4,
+    }
+
+
+def _search_page(page: int, *, has_next_page: bool) -> dict[str, object]:
+    page_content = MOCK_SEARCH_RESPONSE["data"]["Page"]
+    return {
+        "data": {
+            "Page": {
+                **page_content,
+                "pageInfo": {
+                    **page_content["pageInfo"],
+                    "currentPage": page,
+                    "hasNextPage": has_next_page,
+                    "perPage": 5,
+                },
+            },
+        },
+    }
+
+
+@patch("app.media.router.graphql_request")
+def test_search_media_prefetches_next_page(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # The prefetch runs after the response, in its own session.
+    monkeypatch.setattr(router, "engine", test_engine)
+    search_query = random_lower_string()
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        _search_page(2, has_next_page=True),
+        _search_page(3, has_next_page=False),
+    ]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/search/{search_query}",
+        params={"media_type": "ANIME", "page": 2, "per_page": 5},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["pageInfo"]["currentPage"] == 2
+
+    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
+    first_variables = mock_graphql.call_args_list[0].args[1]  # type: ignore[attr-defined]
+    assert (first_variables["page"], first_variables["perPage"]) == (2, 5)
+    prefetch = mock_graphql.call_args_list[1]  # type: ignore[attr-defined]
+    assert prefetch.args[1]["page"] == 3
+    assert prefetch.kwargs["requester"].priority == router.RequestPriority.BACKGROUND
+
+    with Session(test_engine) as session:
+        assert session.get(SearchFile, f"{search_query}:ANIME:3:5") is not None
+
+
+@patch("app.media.router.graphql_request")
+def test_search_media_skips_prefetch_of_cached_next_page(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    search_query = random_lower_string()
+    session_scoped_db.add(
+        SearchFile(
+            search_query=f"{search_query}:ANIME:3:5",
+            content=json.dumps(_search_page(3, has_next_page=False)["data"]["Page"]),
+            data_timestamp=tz_datetime.now(),
+        ),
+    )
+    session_scoped_db.commit()
+    mock_graphql.return_value = _search_page(2, has_next_page=True)  # type: ignore[attr-defined]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/search/{search_query}",
+        params={"media_type": "ANIME", "page": 2, "per_page": 5},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+
+
+def test_is_search_cached_remembers_results_found_in_database(
+    session_scoped_db: Session,
+) -> None:
+    search = router._Search(random_lower_string(), "ANIME", 3, 5)
+    session_scoped_db.add(
+        SearchFile(
+            search_query=search.cache_key,
+            content=json.dumps(_search_page(3, has_next_page=False)["data"]["Page"]),
+            data_timestamp=tz_datetime.now(),
+        ),
+    )
+    session_scoped_db.commit()
+
+    assert router._is_search_cached(session_scoped_db, search)
+    # Later checks don't need the database.
+    assert router._response_cache.contains(f"search:{search.cache_key}")
+
+
+@patch("app.media.router.graphql_request")
+def test_prefetch_gives_way_to_a_download_in_progress(
+    mock_graphql: object,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(router, "engine", test_engine)
+    mock_graphql.return_value = _search_page(3, has_next_page=False)  # type: ignore[attr-defined]
+    search = router._Search(random_lower_string(), "ANIME", 3, 5)
+
+    # Another worker is downloading the page for a user.
+    with Session(test_engine) as downloader:
+        lock_keys(downloader, [f"search:{search.cache_key}"])
+        router._prefetch_search(search, None, router._SERVER)
+        downloader.rollback()
+
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+    with Session(test_engine) as session:
+        assert session.get(SearchFile, search.cache_key) is None
+
+
+@patch("app.media.router.graphql_request")
+def test_search_media_sends_cached_page_as_stored(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    search_query = random_lower_string()
+    contents = {
+        page: json.dumps(_search_page(page, has_next_page=True)["data"]["Page"])
+        for page in (2, 3)
+    }
+    for page, content in contents.items():
+        session_scoped_db.add(
+            SearchFile(
+                search_query=f"{search_query}:ANIME:{page}:5",
+                content=content,
+                data_timestamp=tz_datetime.now(),
+            ),
+        )
+    session_scoped_db.commit()
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/search/{search_query}",
+        params={"media_type": "ANIME", "page": 2, "per_page": 5},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    search_file = session_scoped_db.get(SearchFile, f"{search_query}:ANIME:2:5")
+    assert search_file is not None
+    session_scoped_db.refresh(search_file)
+    # Not serialised again: Postgres spaces its separators, pydantic doesn't.
+    assert response.content == search_file.content.encode()
+    assert mock_graphql.call_count == 0  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_search_media_serves_stale_while_anilist_unavailable(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    mock_graphql.side_effect = AnilistUnavailableError("AniList is down", 30)  # type: ignore[attr-defined]
+    search_query = random_lower_string()
+    session_scoped_db.add(
+        SearchFile(
+            search_query=f"{search_query}:ANIME:1:20",
+            content=json.dumps(MOCK_SEARCH_RESPONSE["data"]["Page"]),
+            data_timestamp=tz_datetime.now() - _PAST_STALE_GRACE,
+        ),
+    )
+    session_scoped_db.commit()
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/search/{search_query}",
+        params={"media_type": "ANIME"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["media"][0]["title"]["romaji"] == "Cowboy Bebop"
+    assert response.headers["X-Cache-Status"] == "stale"
+
+
+@patch("app.media.router.graphql_request")
+def test_read_user_pages_through_chunks(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    first_chunk = {
+        "data": {
+            "anime": {
+                "hasNextChunk": True,
+                "lists": [{"entries": [{"mediaId": 1}], "status": "COMPLETED"}],
+            },
+            "manga": MOCK_USER_RESPONSE["data"]["manga"],
+        },
+    }
+    second_chunk = {
+        "data": {
+            "anime": {
+                "hasNextChunk": False,
+                "lists": [
+                    {"entries": [{"mediaId": 2}], "status": "COMPLETED"},
+                    {"entries": [{"mediaId": 3}], "status": "PLANNING"},
+                ],
+            },
+        },
+    }
+    mock_graphql.side_effect = [first_chunk, second_chunk]  # type: ignore[attr-defined]
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/user/chunkuser")
+    assert response.status_code == status.HTTP_200_OK
+    lists = {
+        group["status"]: [entry["mediaId"] for entry in group["entries"]]
+        for group in response.json()["lists"]
+    }
+    assert lists == {"COMPLETED": [1, 2], "CURRENT": [100], "PLANNING": [3]}
+
+    # Only the unfinished anime list is asked for again.
+    second_query = mock_graphql.call_args.args[0]  # type: ignore[attr-defined]
+    assert "anime:" in second_query
+    assert "manga:" not in second_query
+    assert mock_graphql.call_args.args[1]["chunk"] == 2  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_read_user_refreshes_incrementally(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    session_scoped_db.add(
+        UserFile(
+            id="syncuser",
+            content=json.dumps(
+                {
+                    "lists": [
+                        {
+                            "entries": [{"mediaId": 1}, {"mediaId": 5}],
+                            "status": "PLANNING",
+                            "type": "ANIME",
+                        },
+                        {
+                            "entries": [{"mediaId": 100}],
+                            "status": "CURRENT",
+                            "type": "MANGA",
+                        },
+                    ],
+                },
+            ),
+            data_timestamp=tz_datetime.now() - _PAST_STALE_GRACE,
+            list_updated_at=1000,
+            full_sync_at=tz_datetime.now() - _PAST_STALE_GRACE,
+        ),
+    )
+    session_scoped_db.commit()
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {
+            "Page": {
+                "pageInfo": {"hasNextPage": True},
+                "mediaList": [
+                    {
+                        "mediaId": 5,
+                        "status": "COMPLETED",
+                        "updatedAt": 1200,
+                        "media": {"type": "ANIME"},
+                    },
+                    {
+                        "mediaId": 1,
+                        "status": "PLANNING",
+                        "updatedAt": 900,
+                        "media": {"type": "ANIME"},
+                    },
+                ],
+            },
+        },
+    }
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/user/syncuser")
+    assert response.status_code == status.HTTP_200_OK
+    lists = {
+        group["status"]: [entry["mediaId"] for entry in group["entries"]]
+        for group in response.json()["lists"]
+    }
+    assert lists == {"PLANNING": [1], "CURRENT": [100], "COMPLETED": [5]}
+
+    # The watermark was reached on the first page of updates.
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+    assert mock_graphql.call_args.args[0] == router.USER_LIST_UPDATES_QUERY  # type: ignore[attr-defined]
+    session_scoped_db.expire_all()
+    user_file = session_scoped_db.get(UserFile, "syncuser")
+    assert user_file is not None
+    assert user_file.list_updated_at == 1200
+
+
+def _outdated_media_file(
+    media_id: int,
+    anilist_updated_at: int,
+    age: timedelta = _PAST_STALE_GRACE,
+) -> MediaFile:
+    data_timestamp = tz_datetime.now() - age
+    return MediaFile(
+        id=media_id,
+        content=json.dumps({**MOCK_MEDIA_RESPONSE["data"]["Media"], "id": media_id}),
+        data_timestamp=data_timestamp,
+        update_at=data_timestamp + router.MAX_CACHE_AGE,
+        anilist_updated_at=anilist_updated_at,
+        full_sync_at=data_timestamp,
+    )
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_refetches_only_changed_media(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    session_scoped_db.add(_outdated_media_file(1051, 100))
+    session_scoped_db.add(_outdated_media_file(1052, 100))
+    session_scoped_db.commit()
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        {
+            "data": {
+                "Page": {
+                    "media": [
+                        {"id": 1051, "updatedAt": 100},
+                        {"id": 1052, "updatedAt": 200},
+                    ],
+                },
+            },
+        },
+        {"data": {"media0": {**media, "id": 1052, "updatedAt": 200}}},
+    ]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1051, 1052]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [media["id"] for media in response.json()] == [1051, 1052]
+
+    probe, download = mock_graphql.call_args_list  # type: ignore[attr-defined]
+    assert probe.args[0] == router.MEDIA_UPDATES_QUERY
+    assert probe.args[1]["ids"] == [1051, 1052]
+    assert download.args[1] == {"id0": 1052}
+
+    session_scoped_db.expire_all()
+    unchanged = session_scoped_db.get(MediaFile, 1051)
+    changed = session_scoped_db.get(MediaFile, 1052)
+    assert unchanged is not None
+    assert changed is not None
+    assert not router._is_outdated(unchanged)
+    assert changed.anilist_updated_at == 200
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_refetches_media_probed_for_too_long(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    probed_long = _outdated_media_file(1054, 100)
+    probed_long.full_sync_at = (
+        tz_datetime.now() - router.MAX_MEDIA_FULL_SYNC_AGE - timedelta(days=1)
+    )
+    session_scoped_db.add(probed_long)
+    session_scoped_db.add(_outdated_media_file(1055, 100))
+    session_scoped_db.commit()
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        {"data": {"Page": {"media": [{"id": 1055, "updatedAt": 100}]}}},
+        {"data": {"media0": {**media, "id": 1054, "updatedAt": 100}}},
+    ]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media",
+        params={"media_ids": [1054, 1055]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    # Its recommendations may have changed even though updatedAt hasn't.
+    probe, download = mock_graphql.call_args_list  # type: ignore[attr-defined]
+    assert probe.args[1]["ids"] == [1055]
+    assert download.args[1] == {"id0": 1054}
+    session_scoped_db.expire_all()
+    refetched = session_scoped_db.get(MediaFile, 1054)
+    probed = session_scoped_db.get(MediaFile, 1055)
+    assert refetched is not None
+    assert probed is not None
+    assert not router._needs_full_sync(refetched)
+    assert probed.full_sync_at is not None
+    assert probed.data_timestamp is not None
+    assert probed.full_sync_at < probed.data_timestamp
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_unchanged_is_not_downloaded(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    session_scoped_db: Session,
+) -> None:
+    session_scoped_db.add(_outdated_media_file(1053, 100))
+    session_scoped_db.commit()
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {"Page": {"media": [{"id": 1053, "updatedAt": 100}]}},
+    }
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1053")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["id"] == 1053
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+    assert mock_graphql.call_args.args[0] == router.MEDIA_UPDATES_QUERY  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_serves_stale_and_refreshes_in_background(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # The refresh runs after the response, in its own session.
+    monkeypatch.setattr(router, "engine", test_engine)
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    with Session(test_engine) as session:
+        session.merge(
+            _outdated_media_file(1061, 100, router.MAX_CACHE_AGE + timedelta(days=1)),
+        )
+        session.commit()
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        {"data": {"Page": {"media": [{"id": 1061, "updatedAt": 200}]}}},
+        {"data": {"Media": {**media, "id": 1061, "episodes": 27}}},
+    ]
+
+    response = session_scoped_client.get(
+        f"{settings.API_V1_STR}/media/1061",
+        headers={"X-Request-Priority": "interactive"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["episodes"] == 26
+    assert response.headers["X-Cache-Status"] == "stale"
+
+    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
+    requester = mock_graphql.call_args.kwargs["requester"]  # type: ignore[attr-defined]
+    assert requester.priority == router.RequestPriority.BACKGROUND
+    with Session(test_engine) as session:
+        media_file = session.get(MediaFile, 1061)
+        assert media_file is not None
+        assert json.loads(media_file.content)["episodes"] == 27
+
+
+@patch("app.media.router.graphql_request")
+def test_refresh_expiring_media_refreshes_only_due_media(
+    mock_graphql: object,
+    session_scoped_db: Session,
+) -> None:
+    session_scoped_db.add(
+        _outdated_media_file(1071, 100, router.MAX_CACHE_AGE + timedelta(days=1)),
+    )
+    session_scoped_db.add(_outdated_media_file(1072, 100, timedelta(days=1)))
+    session_scoped_db.commit()
+
+    def probe(
+        _query: str,
+        variables: dict[str, list[int]],
+        *_: object,
+        **__: object,
+    ) -> object:
+        updates = [{"id": media_id, "updatedAt": 100} for media_id in variables["ids"]]
+        return {"data": {"Page": {"media": updates}}}
+
+    mock_graphql.side_effect = probe  # type: ignore[attr-defined]
+
+    assert router.refresh_expiring_media(session_scoped_db, limit=1000) >= 1
+
+    probed = {
+        media_id
+        for call in mock_graphql.call_args_list  # type: ignore[attr-defined]
+        for media_id in call.args[1]["ids"]
+    }
+    assert 1071 in probed
+    assert 1072 not in probed
+    requester = mock_graphql.call_args.kwargs["requester"]  # type: ignore[attr-defined]
+    assert requester.priority == router.RequestPriority.BACKGROUND
+    session_scoped_db.expire_all()
+    media_file = session_scoped_db.get(MediaFile, 1071)
+    assert media_file is not None
+    assert not router._is_outdated(media_file)
+
+
+@patch("app.media.router.graphql_request")
+def test_refresh_expiring_media_backs_off_media_it_cannot_refresh(
+    mock_graphql: object,
+    session_scoped_db: Session,
+) -> None:
+    media_file = _outdated_media_file(
+        1073,
+        100,
+        router.MAX_CACHE_AGE + timedelta(days=2),
+    )
+    session_scoped_db.add(media_file)
+    session_scoped_db.commit()
+    mock_graphql.side_effect = AnilistUnavailableError("AniList is down", 30)  # type: ignore[attr-defined]
+
+    assert router.refresh_expiring_media(session_scoped_db, limit=1000) == 0
+
+    session_scoped_db.expire_all()
+    media_file = session_scoped_db.get(MediaFile, 1073)
+    assert media_file is not None
+    assert media_file.update_at is not None
+    # Retried after as long again as since it was downloaded, at most a week.
+    assert (
+        media_file.update_at
+        > tz_datetime.now()
+        + router.REFRESH_RETRY_MAX
+        - timedelta(
+            minutes=1,
+        )
+    )
+    due = select(MediaFile.id).where(
+        col(MediaFile.update_at) < tz_datetime.now() + router.REFRESH_AHEAD,
+    )
+    assert 1073 not in session_scoped_db.exec(due).all()
+
+
+@patch("app.media.router.graphql_request")
+def test_fetch_media_keeps_batches_stored_before_a_failure(
+    mock_graphql: object,
+    session_scoped_db: Session,
+) -> None:
+    batch_size = router.media_batch_size()
+    media_ids = list(range(1081, 1082 + batch_size))
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.side_effect = [  # type: ignore[attr-defined]
+        {
+            "data": {
+                f"media{index}": {**media, "id": media_id}
+                for index, media_id in enumerate(media_ids[:batch_size])
+            },
+        },
+        AnilistUnavailableError("AniList is down", 30),
+    ]
+
+    with pytest.raises(AnilistUnavailableError):
+        router.fetch_media(session_scoped_db, media_ids)
+    session_scoped_db.rollback()
+
+    stored = session_scoped_db.exec(
+        select(MediaFile.id).where(col(MediaFile.id).in_(media_ids)),
+    ).all()
+    assert sorted(stored) == media_ids[:batch_size]
+
+
+def test_stale_grace_runs_from_each_entrys_expiry() -> None:
+    # A settled title lives far longer than the grace period.
+    downloaded_at = tz_datetime.now() - timedelta(days=200)
+    media_file = MediaFile(
+        id=1,
+        content="{}",
+        data_timestamp=downloaded_at,
+        update_at=downloaded_at + timedelta(days=180),
+    )
+    assert router._can_serve_stale(media_file)
+
+    media_file.update_at = tz_datetime.now() - router.STALE_GRACE - timedelta(days=1)
+    assert not router._can_serve_stale(media_file)
+
+
+def test_parse_response_recognises_not_found() -> None:
+    not_found = httpx.Response(
+        status.HTTP_404_NOT_FOUND,
+        json={"errors": [{"message": "Not Found.", "status": 404}], "data": None},
+    )
+    with pytest.raises(router.AnilistNotFoundError):
+        router._parse_response(not_found)
+
+    server_error = httpx.Response(
+        status.HTTP_400_BAD_REQUEST,
+        json={"errors": [{"message": "Validation error", "status": 400}]},
+    )
+    with pytest.raises(ValueError, match="status code") as exc_info:
+        router._parse_response(server_error)
+    assert not isinstance(exc_info.value, router.AnilistNotFoundError)
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_not_found_is_negatively_cached(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    mock_graphql.side_effect = router.AnilistNotFoundError("Not Found.")  # type: ignore[attr-defined]
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1081")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media/1081")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.headers["X-Cache-Status"] == "negative"
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_skips_negatively_cached_media(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {"media0": {**media, "id": 1082}, "media1": None},
+        "errors": [{"message": "Not Found.", "status": 404}],
+    }
+    params = {"media_ids": [1082, 1083]}
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media", params=params)
+    assert [media["id"] for media in response.json()] == [1082]
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media", params=params)
+    assert [media["id"] for media in response.json()] == [1082]
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_read_media_batch_only_negatively_caches_media_not_found(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {"media0": {**media, "id": 1084}, "media1": None, "media2": None},
+        "errors": [
+            {"message": "Not Found.", "status": 404, "path": ["media1"]},
+            {"message": "Internal Server Error", "status": 500, "path": ["media2"]},
+        ],
+    }
+    params = {"media_ids": [1084, 1085, 1086]}
+
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media", params=params)
+    assert [media["id"] for media in response.json()] == [1084]
+
+    mock_graphql.return_value = {  # type: ignore[attr-defined]
+        "data": {"media0": {**media, "id": 1086}},
+    }
+    response = session_scoped_client.get(f"{settings.API_V1_STR}/media", params=params)
+    assert [media["id"] for media in response.json()] == [1084, 1086]
+    retried = mock_graphql.call_args.args[1]  # type: ignore[attr-defined]
+    assert list(retried.values()) == [1086]
+
+
+@patch("app.media.router.graphql_request")
+def test_read_user_private_list_is_negatively_cached_for_anonymous_requests(
+    mock_graphql: object,
+    session_scoped_client: TestClient,
+) -> None:
+    mock_graphql.side_effect = router.AnilistNotFoundError(  # type: ignore[attr-defined]
+        "Not found on AniList: [{'message': 'Private User', 'status': 404}]",
+    )
+    url = f"{settings.API_V1_STR}/user/privateuser"
+
+    assert session_scoped_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+    response = session_scoped_client.get(url)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert response.headers["X-Cache-Status"] == "negative"
+    assert mock_graphql.call_count == 1  # type: ignore[attr-defined]
+
+    # A logged in user may be allowed to see it.
+    response = session_scoped_client.get(url, headers={"X-Anilist-Token": "token"})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert mock_graphql.call_count == 2  # type: ignore[attr-defined]
@@ -0,0 +1,145 @@
+import threading
+import time
+
+from app.media.rate_limit import RateLimiter
+from app.media.scheduler import PriorityScheduler, Requester, RequestPriority
+
+
+class _GatedRateLimiter(RateLimiter):
+    """Holds the first slot until released, then grants slots immediately."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.holding = threading.Event()
+        self.first = True
+
+    def reserve_slot(self) -> None:
+        if self.first:
+            self.first = False
+            self.holding.set()
+            self.release.wait()
+
+    def apply_cooldown(self, seconds: float) -> None:
+        pass
+
+    def set_limit(self, requests_per_minute: int) -> None:
+        pass
+
+
+def _run_in_order(
+    scheduler: PriorityScheduler,
+    rate_limiter: _GatedRateLimiter,
+    queued: list[tuple[str, Requester]],
+    arrival_gap: float = 0,
+) -> list[str]:
+    order: list[str] = []
+    lock = threading.Lock()
+
+    def request(name: str, requester: Requester) -> None:
+        with scheduler.slot(requester), lock:
+            order.append(name)
+
+    blocker = threading.Thread(
+        target=request,
+        args=("blocker", Requester("blocker", RequestPriority.BACKGROUND)),
+    )
+    blocker.start()
+    rate_limiter.holding.wait()
+
+    threads = []
+    for name, requester in queued:
+        thread = threading.Thread(target=request, args=(name, requester))
+        thread.start()
+        threads.append(thread)
+        # Let each request queue up before the next one arrives.
+        while sum(scheduler.queue_lengths().values()) < len(threads):
+            time.sleep(0.001)
+        time.sleep(arrival_gap)
+
+    rate_limiter.release.set()
+    for thread in [blocker, *threads]:
+        thread.join()
+    return order
+
+
+def test_interactive_requests_jump_the_queue() -> None:
+    rate_limiter = _GatedRateLimiter()
+    scheduler = PriorityScheduler(rate_limiter, aging_seconds=3600, max_in_flight=5)
+
+    order = _run_in_order(
+        scheduler,
+        rate_limiter,
+        [
+            ("background-1", Requester("a", RequestPriority.BACKGROUND)),
+            ("normal", Requester("a", RequestPriority.NORMAL)),
+            ("background-2", Requester("a", RequestPriority.BACKGROUND)),
+            ("interactive", Requester("a", RequestPriority.INTERACTIVE)),
+        ],
+    )
+
+    assert order == ["blocker", "interactive", "normal", "background-1", "background-2"]
+
+
+def test_waiting_requests_age_into_higher_priority() -> None:
+    rate_limiter = _GatedRateLimiter()
+    scheduler = PriorityScheduler(rate_limiter, aging_seconds=0.001, max_in_flight=5)
+
+    order = _run_in_order(
+        scheduler,
+        rate_limiter,
+        [
+            ("background", Requester("a", RequestPriority.BACKGROUND)),
+            ("interactive", Requester("a", RequestPriority.INTERACTIVE)),
+        ],
+        arrival_gap=0.01,
+    )
+    # Aging outweighs the priority gap, so arrival order wins.
+    assert order == ["blocker", "background", "interactive"]
+
+
+def test_clients_share_slots_fairly() -> None:
+    rate_limiter = _GatedRateLimiter()
+    scheduler = PriorityScheduler(rate_limiter, aging_seconds=3600, max_in_flight=5)
+
+    order = _run_in_order(
+        scheduler,
+        rate_limiter,
+        [
+            ("bulk-1", Requester("bulk")),
+            ("bulk-2", Requester("bulk")),
+            ("bulk-3", Requester("bulk")),
+            ("other-1", Requester("other")),
+            ("other-2", Requester("other")),
+        ],
+    )
+
+    assert order == ["blocker", "bulk-1", "other-1", "bulk-2", "other-2", "bulk-3"]
+
+    usage = scheduler.usage("bulk")
+    assert usage.recent_slots == 3
+    assert usage.recent_share == 0.5
+    assert usage.in_flight == 0
+
+
+def test_weighted_clients_get_a_larger_share() -> None:
+    rate_limiter = _GatedRateLimiter()
+    scheduler = PriorityScheduler(
+        rate_limiter,
+        aging_seconds=3600,
+        max_in_flight=5,
+        weights={"heavy": 2},
+    )
+
+    order = _run_in_order(
+        scheduler,
+        rate_limiter,
+        [
+            ("light-1", Requester("light")),
+            ("light-2", Requester("light")),
+            ("heavy-1", Requester("heavy")),
+            ("heavy-2", Requester("heavy")),
+            ("heavy-3", Requester("heavy")),
+        ],
+    )
+
+    assert order == ["blocker", "light-1", "heavy-1", "heavy-2", "light-2", "heavy-3"]
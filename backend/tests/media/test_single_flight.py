@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, create_engine, func, select
+
+from app.media.single_flight import SingleFlight, lock_keys, wait_for_key
+from tests.conftest import test_engine
+
+
+def test_single_flight_shares_result() -> None:
+    single_flight: SingleFlight[int] = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = 0
+
+    def slow_download() -> int:
+        nonlocal calls
+        calls += 1
+        started.set()
+        release.wait()
+        return 42
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(single_flight.do, "media:1", slow_download)
+        started.wait()
+        waiters = [
+            executor.submit(single_flight.do, "media:1", slow_download)
+            for _ in range(2)
+        ]
+        release.set()
+        results = [leader.result(), *(waiter.result() for waiter in waiters)]
+
+    assert results == [42, 42, 42]
+    assert calls == 1
+
+
+def test_single_flight_shares_exception() -> None:
+    single_flight: SingleFlight[int] = SingleFlight()
+
+    def failing_download() -> int:
+        msg = "AniList is down"
+        raise ValueError(msg)
+
+    with pytest.raises(ValueError, match="AniList is down"):
+        single_flight.do("media:1", failing_download)
+
+    # The key is released so the next caller retries.
+    assert single_flight.do("media:1", lambda: 1) == 1
+
+
+def test_lock_keys_blocks_other_sessions() -> None:
+    key = "media:single-flight-test"
+    try_lock = select(func.pg_try_advisory_xact_lock(func.hashtext(key)))
+
+    with Session(test_engine) as holder, Session(test_engine) as other:
+        lock_keys(holder, [key])
+        assert other.exec(try_lock).one() is False
+
+        holder.commit()
+        assert other.exec(try_lock).one() is True
+
+
+def test_wait_for_key_gives_connection_back_between_attempts() -> None:
+    key = "media:single-flight-wait-test"
+    # A pool of one connection, which the waiter must give back while waiting.
+    engine = create_engine(test_engine.url, pool_size=1, max_overflow=0, pool_timeout=1)
+    polling = threading.Event()
+    real_sleep = time.sleep
+
+    def sleep(_: float) -> None:
+        polling.set()
+        real_sleep(0.01)
+
+    def wait() -> None:
+        with Session(engine) as waiter:
+            wait_for_key(waiter, key)
+
+    try:
+        with (
+            ThreadPoolExecutor(max_workers=1) as executor,
+            Session(test_engine) as holder,
+            patch("app.media.single_flight.time.sleep", sleep),
+        ):
+            lock_keys(holder, [key])
+            waiting = executor.submit(wait)
+            assert polling.wait(timeout=5)
+            with Session(engine) as other:
+                assert other.exec(select(1)).one() == 1
+            assert not waiting.done()
+
+            holder.commit()
+            waiting.result(timeout=5)
+    finally:
+        engine.dispose()
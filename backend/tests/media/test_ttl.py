@@ -0,0 +1,74 @@
+import json
+from datetime import UTC, datetime, timedelta
+
+from app.media.models import MediaFile, UserFile
+from app.media.ttl import FixedTtlPolicy, MediaTtlPolicy, UserListTtlPolicy
+
+NOW = datetime(2026, 10, 1, tzinfo=UTC)
+
+
+def _media_file(
+    status: str,
+    end_year: int | None = None,
+    anilist_updated_at: int | None = None,
+) -> MediaFile:
+    content = {"id": 1, "status": status, "endDate": {"year": end_year}}
+    return MediaFile(
+        id=1,
+        content=json.dumps(content),
+        data_timestamp=NOW,
+        anilist_updated_at=anilist_updated_at,
+    )
+
+
+def test_media_ttl_follows_status() -> None:
+    policy = MediaTtlPolicy()
+
+    assert policy.max_age(_media_file("RELEASING")) == timedelta(days=1)
+    assert policy.max_age(_media_file("NOT_YET_RELEASED")) == timedelta(days=3)
+    assert policy.max_age(_media_file("FINISHED", 2026)) == timedelta(days=30)
+    assert policy.max_age(_media_file("FINISHED", 1998)) == timedelta(days=180)
+
+
+def test_media_ttl_shortens_for_recent_changes() -> None:
+    policy = MediaTtlPolicy()
+    edited_last_month = int((NOW - timedelta(days=30)).timestamp())
+    edited_yesterday = int((NOW - timedelta(days=1)).timestamp())
+
+    assert policy.max_age(
+        _media_file("FINISHED", 1998, edited_last_month),
+    ) == timedelta(days=3)
+    assert policy.max_age(
+        _media_file("FINISHED", 1998, edited_yesterday),
+    ) == timedelta(hours=12)
+
+
+def test_user_list_ttl_follows_list_activity() -> None:
+    policy = UserListTtlPolicy()
+
+    def user_file(list_updated_at: datetime | None) -> UserFile:
+        return UserFile(
+            id="user",
+            content="{}",
+            data_timestamp=NOW,
+            list_updated_at=int(list_updated_at.timestamp())
+            if list_updated_at
+            else None,
+        )
+
+    assert policy.max_age(user_file(None)) == timedelta(days=30)
+    assert policy.max_age(user_file(NOW - timedelta(days=10))) == timedelta(days=1)
+    assert policy.max_age(user_file(NOW - timedelta(minutes=5))) == timedelta(hours=6)
+    assert policy.max_age(user_file(NOW - timedelta(days=1000))) == timedelta(days=30)
+
+
+def test_expiry_is_jittered_within_lifetime() -> None:
+    policy = FixedTtlPolicy[MediaFile](timedelta(days=10))
+    media_file = _media_file("FINISHED")
+
+    expiries = {policy.expires_at(media_file) for _ in range(20)}
+
+    assert len(expiries) > 1
+    for expires_at in expiries:
+        assert expires_at is not None
+        assert NOW + timedelta(days=8) <= expires_at <= NOW + timedelta(days=10)
@@ -0,0 +1,133 @@
+import json
+from datetime import date
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from sqlmodel import Session
+
+from app.media import router
+from app.media.circuit_breaker import AnilistUnavailableError
+from app.media.models import MediaFile
+from app.media.queries import WARM_UP_QUERY
+from app.media.warm_up import current_season, warm_up
+from tests.media.test_router import MOCK_MEDIA_RESPONSE
+
+
+def _anilist(pages: dict[int, list[int]]) -> Any:
+    """Answer warm-up pages from ``pages`` and media batches with mock media."""
+    media = MOCK_MEDIA_RESPONSE["data"]["Media"]
+
+    def graphql_request(
+        query: str,
+        variables: dict[str, Any],
+        *_: Any,
+        **__: Any,
+    ) -> Any:
+        if query == WARM_UP_QUERY:
+            page = variables["page"]
+            return {
+                "data": {
+                    "Page": {
+                        "pageInfo": {"hasNextPage": page + 1 in pages},
+                        "media": [{"id": media_id} for media_id in pages[page]],
+                    },
+                },
+            }
+        return {
+            "data": {
+                alias.replace("id", "media"): {**media, "id": media_id}
+                for alias, media_id in variables.items()
+            },
+        }
+
+    return graphql_request
+
+
+def test_current_season() -> None:
+    assert current_season(date(2026, 1, 15)) == ("WINTER", 2026)
+    assert current_season(date(2026, 4, 1)) == ("SPRING", 2026)
+    assert current_season(date(2026, 8, 31)) == ("SUMMER", 2026)
+    assert current_season(date(2026, 10, 17)) == ("FALL", 2026)
+    assert current_season(date(2026, 12, 1)) == ("WINTER", 2027)
+
+
+@patch("app.media.router.graphql_request")
+def test_warm_up_caches_top_media_and_checkpoints(
+    mock_graphql: object,
+    session_scoped_db: Session,
+    tmp_path: Path,
+) -> None:
+    mock_graphql.side_effect = _anilist({1: [3001, 3002]})  # type: ignore[attr-defined]
+    checkpoint = tmp_path / "checkpoint.json"
+
+    assert warm_up(session_scoped_db, ["popular"], 10, checkpoint) == 2
+
+    assert session_scoped_db.get(MediaFile, 3001) is not None
+    assert session_scoped_db.get(MediaFile, 3002) is not None
+    requester = mock_graphql.call_args.kwargs["requester"]  # type: ignore[attr-defined]
+    assert requester.priority == router.RequestPriority.BACKGROUND
+
+    # A completed run starts the next one afresh.
+    assert not checkpoint.exists()
+    mock_graphql.reset_mock()  # type: ignore[attr-defined]
+    assert warm_up(session_scoped_db, ["popular"], 10, checkpoint) == 2
+    assert mock_graphql.called  # type: ignore[attr-defined]
+
+
+@patch("app.media.router.graphql_request")
+def test_warm_up_resumes_from_checkpoint(
+    mock_graphql: object,
+    session_scoped_db: Session,
+    tmp_path: Path,
+) -> None:
+    mock_graphql.side_effect = _anilist({2: [3011]})  # type: ignore[attr-defined]
+    checkpoint = tmp_path / "checkpoint.json"
+    # Left by a run with another limit, and by one that finished the source.
+    checkpoint.write_text(json.dumps({"trending:100": 2, "trending:50": 0}))
+
+    assert warm_up(session_scoped_db, ["trending"], 100, checkpoint) == 1
+
+    first_request = mock_graphql.call_args_list[0]  # type: ignore[attr-defined]
+    assert first_request.args[1]["page"] == 2
+    assert first_request.args[1]["sort"] == ["TRENDING_DESC"]
+    assert session_scoped_db.get(MediaFile, 3011) is not None
+
+
+@patch("app.media.router.graphql_request")
+def test_warm_up_ignores_invalid_checkpoint(
+    mock_graphql: object,
+    session_scoped_db: Session,
+    tmp_path: Path,
+) -> None:
+    mock_graphql.side_effect = _anilist({1: [3011]})  # type: ignore[attr-defined]
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps([2]))
+
+    assert warm_up(session_scoped_db, ["trending"], 100, checkpoint) == 1
+
+    first_request = mock_graphql.call_args_list[0]  # type: ignore[attr-defined]
+    assert first_request.args[1]["page"] == 1
+
+
+@patch("app.media.warm_up.time.sleep")
+@patch("app.media.router.graphql_request")
+def test_warm_up_waits_for_anilist_to_come_back(
+    mock_graphql: object,
+    mock_sleep: object,
+    session_scoped_db: Session,
+    tmp_path: Path,
+) -> None:
+    answer = _anilist({1: [3021]})
+    outage = [AnilistUnavailableError("AniList is down", 600)]
+
+    def graphql_request(*args: Any, **kwargs: Any) -> Any:
+        if outage:
+            raise outage.pop()
+        return answer(*args, **kwargs)
+
+    mock_graphql.side_effect = graphql_request  # type: ignore[attr-defined]
+
+    assert warm_up(session_scoped_db, ["popular"], 10, tmp_path / "checkpoint") == 1
+    mock_sleep.assert_called_once_with(600)  # type: ignore[attr-defined]
+    assert session_scoped_db.get(MediaFile, 3021) is not None
@@ -1,4 +1,8 @@
-import type { app__media__graphql_media_schema__Media } from "@/client"
+import { useQuery } from "@tanstack/react-query"
+import {
+  type app__media__graphql_media_schema__Media,
+  MediaService,
+} from "@/client"
 import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
 
@@ -46,6 +50,16 @@ export function MediaTooltip({
   onClose,
 }: MediaTooltipProps) {
   const { left, top } = clampToViewport(position)
+  // Recommended and related media come with only the fields the graph needs;
+  // a pinned tooltip loads the rest.
+  const { data: details } = useQuery({
+    queryKey: ["media", media.id],
+    queryFn: () => MediaService.readMedia({ mediaId: media.id }),
+    enabled: isPinned && !media.description,
+    staleTime: 1000 * 60 * 5,
+    retry: false,
+  })
+  const description = media.description ?? details?.description
 
   return (
     <div
@@ -109,9 +123,9 @@ export function MediaTooltip({
           </div>
         )}
 
-        {media.description && (
+        {description && (
           <p className="line-clamp-[10] text-xs text-muted-foreground">
-            {media.description.replace(/<[^>]*>/g, "")}
+            {description.replace(/<[^>]*>/g, "")}
           </p>
         )}
 